@@ -1,15 +1,39 @@
+import os
 import random
+import secrets
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from math import ceil
-from gmssl import sm3,func
+
+_HERE = os.path.dirname(os.path.abspath(__file__))
+_ROOT = os.path.join(_HERE, '..', '..')
+sys.path.insert(0, _HERE)
+sys.path.insert(0, os.path.join(_ROOT, 'SM3'))
+sys.path.insert(0, os.path.join(_ROOT, 'SM4'))
+from SM3 import SM3  # noqa: E402
+from gcm import GCMDecryptor, GCMEncryptor  # noqa: E402
+from field import get_backend, test_backends  # noqa: E402
 
 # SM2 椭圆曲线参数(使用普遍标准sm2p256v1)
 p = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFF
 a = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFC
-b = 0x28E9FA9E9D9F5E344D5A9E4BC42E3D4D6CF78E8E1A1A7F9B8EE7EB4A7C0F9E61
+b = 0x28E9FA9E9D9F5E344D5A9E4BCF6509A7F39789F515AB8F92DDBCBD414D940E93
 n = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFF7203DF6B21C6052B53BBF40939D54123
-Gx = 0x32C4AE2C1F1981195F9904466A39C9948FE30BBFF2660BE1714104C9C3E6B041
+Gx = 0x32C4AE2C1F1981195F9904466A39C9948FE30BBFF2660BE1715A4589334C74C7
 Gy = 0xBC3736A2F4F6779C59BDCEE36B692153D0A9877CC62A474002DF32E52139F0A0
 
+# 域运算后端：安装了 gmpy2 时自动使用 mpz，否则为纯 Python 实现
+# 后端只决定元素的整数类型和模逆 FIELD.inv；射影坐标公式直接对元素使用 * 和 % FP，
+# 不调用 FIELD.mul/FIELD.sqr，避免每次运算一次函数调用
+FIELD = get_backend()
+FP = FIELD.p
+
 ###############格式转换函数#################
 # 整数到比特串
 def int_to_bits(x):
@@ -52,7 +76,7 @@ def bits_to_hex(s):
 def hex_to_bits(h):
     b_list = []
     for i in h:
-        b = bin(eval('0x' + i))[2:].rjust(4, '0')           # 增强型for循环，是i不是h
+        b = bin(int(i, 16))[2:].rjust(4, '0')           # 增强型for循环，是i不是h
         b_list.append(b)
     b = ''.join(b_list)
     return b
@@ -60,13 +84,13 @@ def hex_to_bits(h):
 
 # 十六进制到字节串
 def hex_to_bytes(h):
-    h_bits = hex_to_bits(h)
-    h_bytes = bits_to_bytes(h_bits)
-    return h_bytes
+    return bytes.fromhex(h)
 
 ###################椭圆曲线上的运算###############
 # 椭圆曲线上的点
 class Point:
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -75,12 +99,12 @@ class Point:
 
 # 验证某个点是否在椭圆曲线上,椭圆的参数是全局变量
 def on_curve(P):
-    x, y = P
-    if pow(y, 2, p) == ((pow(x, 3, p) + a*x + b) % p):
+    x, y = (P.x, P.y) if isinstance(P, Point) else P
+    if FIELD.sqr(y) == FIELD.reduce(FIELD.mul(FIELD.sqr(x), x) + a*x + b):
         return True
     return False
 
-# 椭圆曲线加法
+# 椭圆曲线加法（仿射坐标的原始实现，不经过域运算后端，作为各标量乘方法的对照）
 def point_add(P, Q):
     if P is None: 
         return Q
@@ -101,8 +125,8 @@ def point_add(P, Q):
     y_r = (lam * (P.x - x_r) - P.y) % p
     return Point(x_r, y_r)
 
-# 椭圆曲线点倍加
-def point_mult(k, P):
+# 椭圆曲线点倍加（仿射坐标，每次点加都要求一次模逆）
+def point_mult_affine(k, P):
     R = None
     T = P
     while k > 0: #通过k移位进行点倍加而不是遍历加
@@ -112,154 +136,1001 @@ def point_mult(k, P):
         k >>= 1
     return R
 
+###############Jacobian 射影坐标##############
+# 射影点 (X, Y, Z) 对应仿射点 (X/Z^2, Y/Z^3)，Z = 0 表示无穷远点
+# 点加和倍点不需要模逆，只在最后转换回仿射坐标时求一次逆
+INF = (1, 1, 0)
+
+def to_jacobian(P):
+    if P is None:
+        return INF
+    return (P.x, P.y, 1)
+
+def to_affine(J):
+    X, Y, Z = J
+    if Z == 0:
+        return None
+    z_inv = FIELD.inv(Z)
+    z_inv2 = z_inv * z_inv % FP
+    return Point(int(X * z_inv2 % FP), int(Y * z_inv2 * z_inv % FP))
+
+# 倍点，利用 a = -3 的形式：alpha = 3(X - Z^2)(X + Z^2)
+def jacobian_double(J):
+    X, Y, Z = J
+    if Z == 0 or Y == 0:
+        return INF
+    delta = Z * Z % FP
+    gamma = Y * Y % FP
+    beta = X * gamma % FP
+    alpha = 3 * (X - delta) * (X + delta) % FP
+    X3 = (alpha * alpha - 8 * beta) % FP
+    Z3 = ((Y + Z) * (Y + Z) - gamma - delta) % FP
+    Y3 = (alpha * (4 * beta - X3) - 8 * gamma * gamma) % FP
+    return (X3, Y3, Z3)
+
+# 一般的射影点加
+def jacobian_add(J1, J2):
+    X1, Y1, Z1 = J1
+    X2, Y2, Z2 = J2
+    if Z1 == 0:
+        return J2
+    if Z2 == 0:
+        return J1
+    Z1Z1 = Z1 * Z1 % FP
+    Z2Z2 = Z2 * Z2 % FP
+    U1 = X1 * Z2Z2 % FP
+    U2 = X2 * Z1Z1 % FP
+    S1 = Y1 * Z2 * Z2Z2 % FP
+    S2 = Y2 * Z1 * Z1Z1 % FP
+    H = (U2 - U1) % FP
+    r = (S2 - S1) % FP
+    if H == 0:
+        if r == 0:
+            return jacobian_double(J1)
+        return INF
+    HH = H * H % FP
+    HHH = H * HH % FP
+    V = U1 * HH % FP
+    X3 = (r * r - HHH - 2 * V) % FP
+    Y3 = (r * (V - X3) - S1 * HHH) % FP
+    Z3 = Z1 * Z2 * H % FP
+    return (X3, Y3, Z3)
+
+# 混合点加：J2 的 Z = 1（仿射点 (x2, y2)），比一般点加少几次乘法
+def jacobian_add_mixed(J1, x2, y2):
+    X1, Y1, Z1 = J1
+    if Z1 == 0:
+        return (x2, y2, 1)
+    Z1Z1 = Z1 * Z1 % FP
+    U2 = x2 * Z1Z1 % FP
+    S2 = y2 * Z1 * Z1Z1 % FP
+    H = (U2 - X1) % FP
+    r = (S2 - Y1) % FP
+    if H == 0:
+        if r == 0:
+            return jacobian_double(J1)
+        return INF
+    HH = H * H % FP
+    HHH = H * HH % FP
+    V = X1 * HH % FP
+    X3 = (r * r - HHH - 2 * V) % FP
+    Y3 = (r * (V - X3) - Y1 * HHH) % FP
+    Z3 = Z1 * H % FP
+    return (X3, Y3, Z3)
+
+# 二进制标量乘：从高位到低位的倍点-混合点加，全程射影坐标，最后求一次逆
+def point_mult_binary(k, P):
+    if P is None or k <= 0:
+        return None
+    x, y = P.x, P.y
+    R = INF
+    for bit in bin(k)[2:]:
+        R = jacobian_double(R)
+        if bit == '1':
+            R = jacobian_add_mixed(R, x, y)
+    return to_affine(R)
+
+# wNAF 窗口宽度
+WNAF_WIDTH = 5
+
+# 计算 k 的宽度为 w 的 NAF 表示，低位在前，非零位都是奇数且 |d| < 2^(w-1)
+def wnaf(k, w=WNAF_WIDTH):
+    digits = []
+    full = 1 << w
+    half = 1 << (w - 1)
+    while k > 0:
+        if k & 1:
+            d = k & (full - 1)
+            if d >= half:
+                d -= full
+            k -= d
+        else:
+            d = 0
+        digits.append(d)
+        k >>= 1
+    return digits
+
+# P, 3P, 5P, ..., (2^(w-1)-1)P 的射影坐标，批量接口可以把多张表合在一起转换
+def odd_multiples_jacobian(P, w=WNAF_WIDTH):
+    J = to_jacobian(P)
+    J2 = jacobian_double(J)
+    points = [J]
+    for _ in range((1 << (w - 2)) - 1):
+        points.append(jacobian_add(points[-1], J2))
+    return points
+
+# 预计算 P, 3P, 5P, ..., (2^(w-1)-1)P 的仿射坐标
+def odd_multiples(P, w=WNAF_WIDTH):
+    return [(Q.x, Q.y) for Q in batch_to_affine(odd_multiples_jacobian(P, w))]
+
+# 用预计算好的奇数倍点表做 wNAF 标量乘，返回射影点
+def wnaf_jacobian(k, table, w=WNAF_WIDTH):
+    R = INF
+    for d in reversed(wnaf(k, w)):
+        R = jacobian_double(R)
+        if d > 0:
+            x, y = table[d >> 1]
+            R = jacobian_add_mixed(R, x, y)
+        elif d < 0:
+            x, y = table[(-d) >> 1]
+            R = jacobian_add_mixed(R, x, p - y)
+    return R
+
+def point_mult_wnaf_table(k, table, w=WNAF_WIDTH):
+    return to_affine(wnaf_jacobian(k, table, w))
+
+# wNAF 变基标量乘：平均每 w+1 位只做一次点加
+def point_mult_wnaf(k, P, w=WNAF_WIDTH):
+    if P is None or k <= 0:
+        return None
+    return point_mult_wnaf_table(k, odd_multiples(P, w), w)
+
+# Montgomery 阶梯：固定迭代 256 次，每次都做一次点加和一次倍点，
+# 运算序列与标量的取值无关，适合私钥等秘密标量
+# （Python 大整数运算本身并非严格常数时间）
+def point_mult_ladder(k, P):
+    if P is None or k <= 0:
+        return None
+    R = [INF, to_jacobian(P)]
+    for i in range(255, -1, -1):
+        bit = (k >> i) & 1
+        R[1 - bit] = jacobian_add(R[0], R[1])
+        R[bit] = jacobian_double(R[bit])
+    return to_affine(R[0])
+
+POINT_MULT_METHODS = {
+    'binary': point_mult_binary,
+    'wnaf': point_mult_wnaf,
+    'ladder': point_mult_ladder,
+}
+
+# 标量乘 [k]P，method 可选 binary / wnaf / ladder
+def point_mult(k, P, method='binary'):
+    try:
+        mult = POINT_MULT_METHODS[method]
+    except KeyError:
+        raise ValueError(f"未知的标量乘方法: {method}")
+    return mult(k, P)
+
 # 椭圆曲线上的基点
 G = Point(Gx, Gy)
 
+# 批量把射影点转换为仿射坐标，利用 Montgomery 技巧只求一次模逆
+def batch_to_affine(points):
+    prefix = []
+    acc = 1
+    for X, Y, Z in points:
+        prefix.append(acc)
+        if Z != 0:
+            acc = acc * Z % FP
+    inv = FIELD.inv(acc)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        if Z == 0:
+            continue
+        z_inv = inv * prefix[i] % FP       # 1 / Z_i
+        inv = inv * Z % FP                 # 去掉 Z_i，得到前 i 个 Z 之积的逆
+        z_inv2 = z_inv * z_inv % FP
+        result[i] = Point(int(X * z_inv2 % FP), int(Y * z_inv2 * z_inv % FP))
+    return result
+
+###############基点 G 的固定基预计算表##############
+# 把 k 按 COMB_WIDTH 位切成若干窗口，第 i 个窗口预先存好 [j * 2^(w*i)]G（j = 1..2^w-1）
+# [k]G 只需每个窗口做一次混合点加，不需要倍点
+COMB_WIDTH = 8
+COMB_WINDOWS = (256 + COMB_WIDTH - 1) // COMB_WIDTH
+# 设置该环境变量后，预计算表会保存到磁盘，下次启动直接加载
+G_TABLE_FILE = os.environ.get('SM2_G_TABLE')
+_G_TABLE = None
+
+# 为点 P 构造宽度为 width 的固定基窗口表
+def build_comb_table(P, width):
+    windows = (256 + width - 1) // width
+    points = []
+    base = to_jacobian(P)
+    for i in range(windows):
+        acc = base
+        for j in range(1, 1 << width):
+            points.append(acc)
+            acc = jacobian_add(acc, base)
+        base = acc   # [2^w] * base
+    affine = batch_to_affine(points)
+    size = (1 << width) - 1
+    return [[(Q.x, Q.y) for Q in affine[i * size:(i + 1) * size]] for i in range(windows)]
+
+# 用窗口表计算 [k]P，每个窗口一次混合点加，返回射影点
+def comb_jacobian(k, table, width):
+    k %= n
+    mask = (1 << width) - 1
+    R = INF
+    for i in range(len(table)):
+        d = (k >> (i * width)) & mask
+        if d:
+            x, y = table[i][d - 1]
+            R = jacobian_add_mixed(R, x, y)
+    return R
+
+def point_mult_comb(k, table, width):
+    return to_affine(comb_jacobian(k, table, width))
+
+def build_g_table():
+    return build_comb_table(G, COMB_WIDTH)
+
+# 先写入同目录下的临时文件再原子替换，其他进程不会读到写了一半的表
+def save_g_table(path, table):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes([COMB_WIDTH]))
+            for window in table:
+                for x, y in window:
+                    f.write(x.to_bytes(32, 'big') + y.to_bytes(32, 'big'))
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+# 不求逆检查仿射点 R == P + Q（P != ±Q 时用割线，P == Q 时用切线）：
+# 斜率 λ = num / den，要求 x_R = λ^2 - x_P - x_Q 且 -R 在直线上
+def _is_affine_sum(P, Q, R):
+    (xP, yP), (xQ, yQ), (xR, yR) = P, Q, R
+    if P == Q:
+        num, den = (3 * xP * xP + a) % p, 2 * yP % p
+    else:
+        num, den = (yQ - yP) % p, (xQ - xP) % p
+    if den == 0:
+        return False
+    return ((xR + xP + xQ) * den * den - num * num) % p == 0 and ((yR + yP) * den - num * (xP - xR)) % p == 0
+
+# 校验从磁盘加载的表：第一项是 G，窗口内 [j+1]B = [j]B + B，下一窗口的 B' = [2^w - 1]B + B，
+# 整张表由 G 逐项确定，只用乘法，不需要模逆
+def check_g_table(table):
+    if table[0][0] != (Gx, Gy):
+        raise ValueError("预计算表校验失败：第一项不是基点 G！")
+    for i, window in enumerate(table):
+        B = window[0]
+        for j in range(1, len(window)):
+            if not _is_affine_sum(window[j - 1], B, window[j]):
+                raise ValueError(f"预计算表校验失败：第 {i} 个窗口第 {j} 项错误！")
+        if i + 1 < len(table) and not _is_affine_sum(window[-1], B, table[i + 1][0]):
+            raise ValueError(f"预计算表校验失败：第 {i + 1} 个窗口的基点错误！")
+    return table
+
+def load_g_table(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = (1 << COMB_WIDTH) - 1
+    if not data or data[0] != COMB_WIDTH or len(data) != 1 + COMB_WINDOWS * size * 64:
+        raise ValueError("预计算表文件格式错误！")
+    table = []
+    for i in range(COMB_WINDOWS):
+        window = []
+        for j in range(size):
+            off = 1 + (i * size + j) * 64
+            window.append((int.from_bytes(data[off:off + 32], 'big'),
+                           int.from_bytes(data[off + 32:off + 64], 'big')))
+        table.append(window)
+    return check_g_table(table)
+
+# 第一次使用时才构造（或从磁盘加载）预计算表
+def get_g_table():
+    global _G_TABLE
+    if _G_TABLE is None:
+        table = None
+        if G_TABLE_FILE and os.path.exists(G_TABLE_FILE):
+            try:
+                table = load_g_table(G_TABLE_FILE)
+            except (OSError, ValueError):
+                table = None
+        if table is None:
+            table = build_g_table()
+            _G_TABLE = table
+            # 磁盘上的表只是可选的缓存，写不进去时照常使用内存中的表
+            if G_TABLE_FILE:
+                try:
+                    save_g_table(G_TABLE_FILE, table)
+                except OSError:
+                    pass
+        _G_TABLE = table
+    return _G_TABLE
+
+# 固定基标量乘 [k]G
+def point_mult_base(k):
+    return point_mult_comb(k, get_g_table(), COMB_WIDTH)
+
+###############接收方公钥的预计算缓存##############
+# 公钥编码为 04 || x || y（未压缩格式）
+def encode_public_key(P):
+    return b'\x04' + P.x.to_bytes(32, 'big') + P.y.to_bytes(32, 'big')
+
+def decode_public_key(data):
+    if len(data) != 65 or data[0] != 0x04:
+        raise ValueError("公钥编码格式错误！")
+    return Point(int.from_bytes(data[1:33], 'big'), int.from_bytes(data[33:], 'big'))
+
+# 校验公钥：不是无穷远点、坐标在 [0, p) 内且在曲线上（余因子 h = 1，在曲线上即在 G 生成的群中）
+def validate_public_key(P):
+    if P is None or P.x is None or P.y is None:
+        raise ValueError("公钥是无穷远点！")
+    if not (0 <= P.x < p and 0 <= P.y < p) or not on_curve(P):
+        raise ValueError("公钥不在椭圆曲线上！")
+    return P
+
+# 接收方公钥窗口表的宽度，比 G 的表小，构造更快、占用内存更少
+RECIPIENT_COMB_WIDTH = 4
+RECIPIENT_CACHE_SIZE = 64
+# 同一公钥出现这么多次后才构造窗口表：构表的开销约为一次普通标量乘的 4 倍，
+# 只用一次的接收方直接做 wNAF 更快
+RECIPIENT_PROMOTE_AFTER = 2
+
+# 有界 LRU 缓存：以编码后的公钥为键，保存校验过的点和它的窗口表
+class PublicKeyCache:
+    def __init__(self, maxsize=RECIPIENT_CACHE_SIZE, width=RECIPIENT_COMB_WIDTH,
+                 promote_after=RECIPIENT_PROMOTE_AFTER):
+        self.maxsize = maxsize
+        self.width = width
+        self.promote_after = promote_after
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # 公钥编码 -> (点, 窗口表, 估算字节数)
+        self._seen = OrderedDict()      # 还没有窗口表的公钥编码 -> 出现次数，容量为 maxsize 的 4 倍
+        self._lock = threading.Lock()
+
+    # 返回 (校验过的点, 窗口表)；公钥出现次数不足 promote_after 时窗口表为 None
+    def get(self, PB):
+        key = encode_public_key(PB) if isinstance(PB, Point) else bytes(PB)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0], entry[1]
+            self.misses += 1
+            count = self._seen.pop(key, 0) + 1
+            if count < self.promote_after:
+                self._seen[key] = count
+                while len(self._seen) > 4 * self.maxsize:
+                    self._seen.popitem(last=False)
+        P = validate_public_key(decode_public_key(key))
+        if count < self.promote_after:
+            return P, None
+        # 构造窗口表时不持有锁，其他线程可以继续命中缓存
+        table = build_comb_table(P, self.width)
+        size = sum(sys.getsizeof(x) + sys.getsizeof(y) + sys.getsizeof((x, y))
+                   for window in table for x, y in window)
+        size += sum(sys.getsizeof(window) for window in table) + sys.getsizeof(table)
+        with self._lock:
+            self._entries[key] = (P, table, size)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return P, table
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+            self.hits = self.misses = 0
+
+    # 命中/未命中次数以及缓存占用的内存估计
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'pending': len(self._seen),
+                'maxsize': self.maxsize,
+                'memory_bytes': sum(e[2] for e in self._entries.values()),
+            }
+
+recipient_cache = PublicKeyCache()
+
 ###############正式步骤及函数##############
 ###sm3哈希函数
 def sm3_hash(data):
-    data_bytes = func.bytes_to_list(data)
-    hash_hex = sm3.sm3_hash(data_bytes)
-    hash_bytes = bytes.fromhex(hash_hex)
-    return hash_bytes
+    return SM3(data).digest()
 
-# 密钥派生函数（KDF）
-def KDF(Z, klen):
-    v = 256           # 密码杂凑函数采用SM3
-    if klen >= (pow(2, 32) - 1) * v:
-        raise Exception("密钥派生函数KDF出错，请检查klen的大小！")
-    ct = 0x00000001
-    if klen % v == 0:
-        l = klen // v
-    else:
-        l = klen // v + 1
-    Ha = []
-    for i in range(l):         # i从0到 klen/v-1（向上取整）,共l个元素
-        s = Z + int_to_bits(ct).rjust(32, '0')         # s存储 Z || ct 的比特串形式 
-        s_bytes = bits_to_bytes(s)          # s_bytes存储字节串形式
-        s_list = [i for i in s_bytes]
-        hash_hex = sm3.sm3_hash(s_list)
-        hash_bin = hex_to_bits(hash_hex)
-        Ha.append(hash_bin)
+# KDF 每批生成的哈希分组数（32 字节一组）
+KDF_BATCH = 2048
+
+# 密钥派生函数（KDF）的流式版本：依次产生 Hash(Z || ct) 的 32 字节分组
+# Z = x2 || y2 恰好是一个 64 字节分组，只压缩一次，之后每个 ct 只压缩最后一个分组
+def KDF_stream(Z):
+    base = SM3(Z)
+    ct = 1
+    while True:
+        if ct >= 2 ** 32 - 1:
+            raise Exception("密钥派生函数KDF出错，请检查klen的大小！")
+        h = base.copy()
+        h.update(ct.to_bytes(4, 'big'))
+        yield h.digest()
         ct += 1
-    if klen % v != 0: #不能整除则只取klen长苏借调最后一个哈希值的剩余部分
-        Ha[-1] = Ha[-1][:klen - v*(klen//v)]
-    k = ''.join(Ha)
-    return k
 
+# 密钥派生函数（KDF），Z 为字节串，klen 为输出的字节数
+def KDF(Z, klen):
+    out = bytearray()
+    for block in KDF_stream(Z):
+        if len(out) >= klen:
+            break
+        out += block
+    return bytes(out[:klen])
+
+# data 与 KDF(Z, len(data)) 逐批异或，返回 (结果, t 是否全为 0)
+def KDF_xor(Z, data):
+    data = memoryview(data).cast('B')
+    out = bytearray()
+    nonzero = 0
+    stream = KDF_stream(Z)
+    step = KDF_BATCH * 32
+    for off in range(0, len(data), step):
+        chunk = data[off:off + step]
+        t = b''.join(next(stream) for _ in range(-(-len(chunk) // 32)))[:len(chunk)]
+        t_int = int.from_bytes(t, 'big')
+        nonzero |= t_int
+        out += (int.from_bytes(chunk, 'big') ^ t_int).to_bytes(len(chunk), 'big')
+    return bytes(out), nonzero == 0
+
+# 把旧版本的 '0'/'1' 比特串密文转换为字节串
+def _as_bytes(C):
+    if isinstance(C, str):
+        return bits_to_bytes(C)
+    return bytes(C)
+
+# 用密码学安全的随机数生成器产生 [1, n-1] 内的随机数
+def random_scalar():
+    return secrets.randbelow(n - 1) + 1
+
+# 生成一对与消息和接收方无关的 (k, C1 = [k]G)
+def make_nonce():
+    k = random_scalar()
+    return k, point_mult_base(k)
+
+###############离线/在线加密：(k, [k]G) 预计算池##############
+# 后台线程在池中数量降到 low 时补充到 high；取空时在线计算并计入 exhausted
+NONCE_POOL_LOW = 16
+NONCE_POOL_HIGH = 64
 
+# 所有存活的池，fork 之后在子进程中清空
+_NONCE_POOLS = weakref.WeakSet()
 
-#####SM2 加密函数
-def sm2_encrypt(PB, M):
-    print("=========加密部分========")
+def _reset_nonce_pools():
+    for pool in list(_NONCE_POOLS):
+        pool._after_fork()
 
-    # A1: 生成随机数 k
-    k = random.randint(1, n - 1)  
-    print(f"随机数 k: {k}")
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_nonce_pools)
 
-    # A2: 计算椭圆曲线点 C1 = [k]G
-    C1 = point_mult(k, G)
+class NoncePool:
+    def __init__(self, low=NONCE_POOL_LOW, high=NONCE_POOL_HIGH, start=True):
+        if not 0 <= low < high:
+            raise ValueError("水位设置错误，要求 0 <= low < high")
+        self.low = low
+        self.high = high
+        self.exhausted = 0      # 池为空、只能在线计算的次数
+        self.produced = 0
+        self.consumed = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = None
+        _NONCE_POOLS.add(self)
+        if start:
+            self.start()
+
+    # 子进程继承了父进程池中的 (k, C1)，再用会与父进程重复使用同一个 k，泄露 M1 ⊕ M2；
+    # 因此全部丢弃。锁可能在 fork 时被父进程的线程持有，也一并重建；后台线程不会被继承，需重新启动
+    def _after_fork(self):
+        running = self._thread is not None
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.produced = self.consumed = self.exhausted = 0
+        if running and not self._stopped:
+            self.start()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._fill, name='sm2-nonce-pool', daemon=True)
+            self._thread.start()
+
+    def _fill(self):
+        while True:
+            with self._cond:
+                # 补到高水位后等待，直到被取到低水位
+                while not self._stopped and len(self._items) > self.low:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                need = self.high - len(self._items)
+            for _ in range(need):
+                item = make_nonce()
+                with self._cond:
+                    if self._stopped:
+                        return
+                    self._items.append(item)
+                    self.produced += 1
+
+    # 取出一对 (k, C1)；每对只会被使用一次
+    def get(self):
+        with self._cond:
+            self.consumed += 1
+            if self._items:
+                item = self._items.popleft()
+                if len(self._items) <= self.low:
+                    self._cond.notify()
+                return item
+            self.exhausted += 1
+            self._cond.notify()
+        return make_nonce()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'available': len(self._items),
+                'low': self.low,
+                'high': self.high,
+                'produced': self.produced,
+                'consumed': self.consumed,
+                'exhausted': self.exhausted,
+            }
+
+    def close(self):
+        with self._cond:
+            self._stopped = True
+            self._items.clear()
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+#####SM2 加密函数，返回字节串 C = C1 || C2 || C3
+# nonce_pool 不为空时从池中取出预先算好的 (k, C1)，在线只做与接收方有关的部分
+# verbose 为 True 时打印中间结果，其中 (x2, y2) 是共享秘密，只能用于演示
+def sm2_encrypt(PB, M, method='wnaf', use_cache=True, nonce_pool=None, verbose=False):
+    if verbose:
+        print("=========加密部分========")
+
+    # A1, A2: 生成随机数 k，计算椭圆曲线点 C1 = [k]G
+    if nonce_pool is not None:
+        k, C1 = nonce_pool.get()
+    else:
+        k, C1 = make_nonce()
     x1_bytes = C1.x.to_bytes(32, 'big')
     y1_bytes = C1.y.to_bytes(32, 'big')
-    x1_bits = bytes_to_bits(x1_bytes)
-    y1_bits = bytes_to_bits(y1_bytes)
-    print(f"椭圆曲线点 C1: (x1 = {C1.x}, y1 = {C1.y}")
+    if verbose:
+        print(f"椭圆曲线点 C1: (x1 = {C1.x}, y1 = {C1.y}")
        
-    # A3: 计算 S = [h]PB
-    h = 1  # 通常为 1
-    S = point_mult(h, PB)
-    if S.is_infinity():
-        raise ValueError("S 是无穷远点，报错退出")
-    print(f"计算出的 S 点: (x2 = {S.x}, y2 = {S.y})")
-
-    # A4: 计算 P_B = [k]PB
-    P_B = point_mult(k, PB)
+    if use_cache:
+        # A3: 缓存中的公钥已校验过，h = 1 时 S = PB 不是无穷远点
+        # A4: 有窗口表时用它计算 P_B = [k]PB，否则（新接收方）直接做标量乘
+        PB, table = recipient_cache.get(PB)
+        if table is not None:
+            P_B = point_mult_comb(k, table, recipient_cache.width)
+        else:
+            P_B = point_mult(k, PB, method)
+    else:
+        # A3: 计算 S = [h]PB
+        h = 1  # 通常为 1
+        S = point_mult(h, PB)
+        if S is None:
+            raise ValueError("S 是无穷远点，报错退出")
+        if verbose:
+            print(f"计算出的 S 点: (x2 = {S.x}, y2 = {S.y})")
+
+        # A4: 计算 P_B = [k]PB
+        P_B = point_mult(k, PB, method)
     x2_bytes = P_B.x.to_bytes(32, 'big')
     y2_bytes = P_B.y.to_bytes(32, 'big')
-    x2_bits = bytes_to_bits(x2_bytes)
-    y2_bits = bytes_to_bits(y2_bytes)
-    print(f"计算出的 P_B 点: (x2 = {P_B.x}, y2 = {P_B.y})")
-
-    # A5: 计算 t = KDF(x2 || y2, klen)
-    klen = len(M) * 8  # 消息 M 的比特长度
-    t = KDF(x2_bits + y2_bits, klen)
-    if int(t, 2) == 0:  # 若 t 是全 0 比特串
-        print("生成的密钥 t 为全 0 比特串，重新生成 k")
-        return sm2_encrypt(PB, M)  # 递归重新加密
-    print(f"派生的密钥 t的十六进制串形式: {bits_to_hex(t)}")
-
-    # A6: 计算 C2 = M ⊕ t
-    M_bits = bytes_to_bits(M)  # 将消息 M 转换为比特串
-    C2_bits = ''.join('1' if m != t_i else '0' for m, t_i in zip(M_bits, t))  # 逐位异或
-    C2_bytes=bits_to_bytes(C2_bits)
-    print(f"加密后的消息 C2 : {bits_to_hex(C2_bits)}")
-
-    # A7: 计算 C3 = Hash(x2 || M || y2)
-    C3 = sm3_hash(bits_to_bytes(x2_bits + M_bits + y2_bits))  # 计算哈希值
-    print(f"哈希值 C3: {C3.hex()}")
+    if verbose:
+        print(f"计算出的 P_B 点: (x2 = {P_B.x}, y2 = {P_B.y})")
+
+    # A5, A6: t = KDF(x2 || y2, klen)，C2 = M ⊕ t，按批生成 t 并整段异或
+    C2, t_is_zero = KDF_xor(x2_bytes + y2_bytes, M)
+    if t_is_zero and len(M) > 0:  # 若 t 是全 0 比特串
+        if verbose:
+            print("生成的密钥 t 为全 0 比特串，重新生成 k")
+        return sm2_encrypt(PB, M, method, use_cache, nonce_pool, verbose)  # 递归重新加密
+
+    # A7: 计算 C3 = Hash(x2 || M || y2)，流式哈希，不拼接整条消息
+    h3 = SM3(x2_bytes)
+    h3.update(M)
+    h3.update(y2_bytes)
+    C3 = h3.digest()
+    if verbose:
+        print(f"哈希值 C3: {C3.hex()}")
 
     # A8: 输出密文 C = C1 || C2 || C3
-    C1_bits = x1_bits + y1_bits  # 拼接 C1 的比特串
-    complete_cipher = C1_bits + C2_bits + bytes_to_bits(C3)
-    return complete_cipher
+    return x1_bytes + y1_bytes + C2 + C3
 
 
-def sm2_decrypt(dB, C):
-    print("==========解密部分==========")
+# 解密，C 可以是字节串，也可以是旧版本的比特串密文
+def sm2_decrypt(dB, C, method='wnaf', verbose=False):
+    if verbose:
+        print("==========解密部分==========")
+    C = _as_bytes(C)
+    if len(C) < 96:
+        raise ValueError("密文长度错误！")
 
-    # A1: 从密文中提取比特串 C1
-    C1_bits = C[:512]  # 提取前 512 位为 C1 的比特串
-    x1_bytes = bits_to_bytes(C1_bits[:256])
-    y1_bytes = bits_to_bytes(C1_bits[256:])
-    x1 = int.from_bytes(x1_bytes, 'big')
-    y1 = int.from_bytes(y1_bytes, 'big')
+    # A1: 从密文中取出 C1
+    x1 = int.from_bytes(C[:32], 'big')
+    y1 = int.from_bytes(C[32:64], 'big')
     C1 = Point(x1, y1)
 
     # A2:验证C1是否在椭圆曲线上
-    if not (C1):
-        print("C1不在椭圆曲线的点上")
-    print(f"椭圆曲线点 C1: (x1 = {C1.x}, y1 = {C1.y})")
+    if not on_curve(C1):
+        raise ValueError("C1不在椭圆曲线的点上")
+    if verbose:
+        print(f"椭圆曲线点 C1: (x1 = {C1.x}, y1 = {C1.y})")
 
     # A3: 计算 P_B = [dB]C1
-    P_B = point_mult(dB, C1)
+    P_B = point_mult(dB, C1, method)
     x2_bytes = P_B.x.to_bytes(32, 'big')
     y2_bytes = P_B.y.to_bytes(32, 'big')
-    x2_bits = bytes_to_bits(x2_bytes)
-    y2_bits = bytes_to_bits(y2_bytes)
-    x2_hex=bits_to_hex(x2_bits)
-    y2_hex=bits_to_hex(y2_bits)
-    print("解密得到的[dB]C1=(x2,y2)的十六进制串形式是：", (x2_hex, y2_hex))
-
-    # A4: 计算 t = KDF(x2 || y2, klen)
-    C2_bits = C[512:-256]  # 提取 C2 的比特串(C1和C3的长度确定因此得到C2)
-    C2_hex=bits_to_hex(C2_bits)
-    print("C2的十六进制串形式是：", C2_hex)
-    klen = len(C2_bits)
-    t = KDF(x2_bits + y2_bits, klen)
-    print(f"派生的密钥 t的十六进制串形式: {bits_to_hex(t)}")
-
-    # A5: 从密文中提取比特串 C2，计算 M = C2 ⊕ t
-    M_bits = ''.join('1' if c2 != t_i else '0' for c2, t_i in zip(C2_bits, t))  # 逐位异或
-    M = bits_to_bytes(M_bits)
+    if verbose:
+        print("解密得到的[dB]C1=(x2,y2)的十六进制串形式是：", (x2_bytes.hex(), y2_bytes.hex()))
+
+    # A4, A5: t = KDF(x2 || y2, klen)，M = C2 ⊕ t
+    C2 = memoryview(C)[64:-32]
+    M, t_is_zero = KDF_xor(x2_bytes + y2_bytes, C2)
+    if t_is_zero and len(C2) > 0:
+        raise ValueError("派生的密钥 t 为全 0 比特串，解密失败")
 
     # A6: 验证 C3
-    C3_bits = C[-256:]  # 提取 C3 的比特串
-    C3_hex=bits_to_hex(C3_bits)
-    print("从C中取出的C3的十六进制形式是：", C3_hex)
-    u_bytes = sm3_hash(bits_to_bytes(x2_bits + M_bits + y2_bits)) #计算u验证是否与C3相等
-    print("计算的u = Hash(x2 ∥ M′ ∥ y2)是：", bytes_to_hex(u_bytes))
-    if u_bytes != bits_to_bytes(C3_bits):
+    C3 = C[-32:]
+    if verbose:
+        print("从C中取出的C3的十六进制形式是：", C3.hex())
+    h3 = SM3(x2_bytes)
+    h3.update(M)
+    h3.update(y2_bytes)
+    u_bytes = h3.digest() #计算u验证是否与C3相等
+    if verbose:
+        print("计算的u = Hash(x2 ∥ M′ ∥ y2)是：", u_bytes.hex())
+    if u_bytes != C3:
         raise ValueError("验证失败，C3 不匹配，解密失败")
-    print("C3验证成功!")
+    if verbose:
+        print("C3验证成功!")
     return M
 
 # 生成密钥对
 def generate_keypair():
-    dB = random.randint(1, n - 1)
-    PB = point_mult(dB, G)
+    dB = random_scalar()
+    PB = point_mult_base(dB)
     return dB, PB
 
     
+###############SM2 数字签名##############
+# 默认用户标识
+DEFAULT_ID = b'1234567812345678'
+SIGNER_CACHE_SIZE = 256
+
+# G 的奇数倍点表，验签时的多标量乘使用
+_G_ODD = None
+
+def get_g_odd_multiples():
+    global _G_ODD
+    if _G_ODD is None:
+        _G_ODD = odd_multiples(G)
+    return _G_ODD
+
+# ZA = SM3(ENTLA || IDA || a || b || xG || yG || xA || yA)
+def compute_za(ID, PA):
+    entl = len(ID) * 8
+    if entl >= 1 << 16:
+        raise ValueError("用户标识过长！")
+    h = SM3(entl.to_bytes(2, 'big') + ID)
+    for v in (a, b, Gx, Gy, PA.x, PA.y):
+        h.update(v.to_bytes(32, 'big'))
+    return h.digest()
+
+# 按 (ID, 公钥) 缓存签名者信息：ZA、校验过的公钥和公钥的奇数倍点表
+@lru_cache(maxsize=SIGNER_CACHE_SIZE)
+def _signer_context(ID, PA_bytes):
+    PA = validate_public_key(decode_public_key(PA_bytes))
+    return compute_za(ID, PA), PA, odd_multiples(PA)
+
+def signer_cache_info():
+    return _signer_context.cache_info()
+
+# e = SM3(ZA || M)
+def _sign_digest(ZA, M):
+    h = SM3(ZA)
+    h.update(M)
+    return int.from_bytes(h.digest(), 'big')
+
+# Shamir/Straus 多标量乘 [u]P + [v]Q：两个标量的 wNAF 共用同一串倍点
+def multi_scalar_mult(u, table_P, v, table_Q, w=WNAF_WIDTH):
+    return to_affine(multi_scalar_jacobian(u, table_P, v, table_Q, w))
+
+def multi_scalar_jacobian(u, table_P, v, table_Q, w=WNAF_WIDTH):
+    du = wnaf(u, w)
+    dv = wnaf(v, w)
+    length = max(len(du), len(dv))
+    du += [0] * (length - len(du))
+    dv += [0] * (length - len(dv))
+    R = INF
+    for i in range(length - 1, -1, -1):
+        R = jacobian_double(R)
+        for d, table in ((du[i], table_P), (dv[i], table_Q)):
+            if d > 0:
+                x, y = table[d >> 1]
+                R = jacobian_add_mixed(R, x, y)
+            elif d < 0:
+                x, y = table[(-d) >> 1]
+                R = jacobian_add_mixed(R, x, p - y)
+    return R
+
+# 签名，返回 64 字节 r || s
+def sm2_sign(dA, M, PA=None, ID=DEFAULT_ID):
+    if PA is None:
+        PA = point_mult_base(dA)
+    ZA = _signer_context(bytes(ID), encode_public_key(PA))[0]
+    e = _sign_digest(ZA, M)
+    d_inv = pow(1 + dA, -1, n)
+    while True:
+        k, P1 = make_nonce()
+        r = (e + P1.x) % n
+        if r == 0 or r + k == n:
+            continue
+        s = d_inv * (k - r * dA) % n
+        if s != 0:
+            return r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+
+# 验签的前半部分：检查 r, s 的范围并计算射影点 [s]G + [t]PA，返回 (e, r, 射影点)，无效时返回 None
+def _verify_prepare(PA, M, signature, ID):
+    if len(signature) != 64:
+        return None
+    r = int.from_bytes(signature[:32], 'big')
+    s = int.from_bytes(signature[32:], 'big')
+    if not (1 <= r < n and 1 <= s < n):
+        return None
+    t = (r + s) % n
+    if t == 0:
+        return None
+    ZA, PA, table_PA = _signer_context(bytes(ID), encode_public_key(PA) if isinstance(PA, Point) else bytes(PA))
+    e = _sign_digest(ZA, M)
+    return e, r, multi_scalar_jacobian(s, get_g_odd_multiples(), t, table_PA)
+
+def _verify_finish(e, r, P1):
+    return P1 is not None and (e + P1.x) % n == r
+
+# 验签：计算 (x1, y1) = [s]G + [t]PA，检查 R = (e + x1) mod n 是否等于 r
+def sm2_verify(PA, M, signature, ID=DEFAULT_ID):
+    prepared = _verify_prepare(PA, M, signature, ID)
+    if prepared is None:
+        return False
+    e, r, J = prepared
+    return _verify_finish(e, r, to_affine(J))
+
+###############批量接口##############
+# 批量接口先把各个结果保留为射影点，再用 batch_to_affine 共用一次模逆；
+# 数据按 BATCH_CHUNK 分块，由进程池并行处理，结果保持输入顺序
+BATCH_CHUNK = 256
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def _fan_out(func, chunks, workers):
+    if workers == 1 or len(chunks) <= 1:
+        results = [func(c) for c in chunks]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(func, chunks))
+    return [r for chunk in results for r in chunk]
+
+def _keypair_chunk(count):
+    scalars = [random_scalar() for _ in range(count)]
+    table = get_g_table()
+    points = batch_to_affine([comb_jacobian(d, table, COMB_WIDTH) for d in scalars])
+    return list(zip(scalars, points))
+
+# 批量生成 count 对密钥，返回 [(dB, PB), ...]
+def generate_keypairs(count, workers=None, chunk=BATCH_CHUNK):
+    sizes = [min(chunk, count - i) for i in range(0, count, chunk)]
+    return _fan_out(_keypair_chunk, sizes, workers)
+
+# 整块共用两次模逆：所有 C1 的奇数倍点表一起转为仿射坐标，所有 [dB]C1 再一起转换
+def _decrypt_chunk(args):
+    dB, ciphertexts = args
+    parsed = []
+    tables = []
+    for C in ciphertexts:
+        C = _as_bytes(C)
+        C1 = Point(int.from_bytes(C[:32], 'big'), int.from_bytes(C[32:64], 'big')) if len(C) >= 96 else None
+        if C1 is None or not on_curve(C1):
+            parsed.append(None)
+            continue
+        parsed.append(C)
+        tables.extend(odd_multiples_jacobian(C1))
+    size = 1 << (WNAF_WIDTH - 2)
+    affine = [(Q.x, Q.y) for Q in batch_to_affine(tables)]
+    jacobians = []
+    pos = 0
+    for C in parsed:
+        if C is None:
+            jacobians.append(INF)
+            continue
+        jacobians.append(wnaf_jacobian(dB, affine[pos:pos + size]))
+        pos += size
+    results = []
+    for C, P_B in zip(parsed, batch_to_affine(jacobians)):
+        if C is None or P_B is None:
+            results.append(None)
+            continue
+        x2_bytes = P_B.x.to_bytes(32, 'big')
+        y2_bytes = P_B.y.to_bytes(32, 'big')
+        C2 = memoryview(C)[64:-32]
+        M, t_is_zero = KDF_xor(x2_bytes + y2_bytes, C2)
+        h3 = SM3(x2_bytes)
+        h3.update(M)
+        h3.update(y2_bytes)
+        if (t_is_zero and len(C2) > 0) or h3.digest() != C[-32:]:
+            results.append(None)
+        else:
+            results.append(M)
+    return results
+
+# 批量解密同一私钥的多个密文，返回明文列表；解密失败的位置为 None
+def decrypt_many(dB, ciphertexts, workers=None, chunk=BATCH_CHUNK):
+    chunks = [(dB, c) for c in _chunks(list(ciphertexts), chunk)]
+    return _fan_out(_decrypt_chunk, chunks, workers)
+
+def _verify_chunk(items):
+    prepared = []
+    for item in items:
+        PA, M, signature = item[:3]
+        ID = item[3] if len(item) > 3 else DEFAULT_ID
+        try:
+            prepared.append(_verify_prepare(PA, M, signature, ID))
+        except ValueError:
+            prepared.append(None)
+    points = batch_to_affine([pr[2] if pr else INF for pr in prepared])
+    return [pr is not None and _verify_finish(pr[0], pr[1], P1) for pr, P1 in zip(prepared, points)]
+
+# 批量验签，items 为 (公钥, 消息, 签名[, ID]) 的序列，返回布尔值列表
+def verify_many(items, workers=None, chunk=BATCH_CHUNK):
+    return _fan_out(_verify_chunk, _chunks(list(items), chunk), workers)
+
+###############SM2 + SM4 数字信封##############
+# 用 SM2 加密一个随机的 SM4 密钥，负载按固定大小分块用 SM4-GCM 流式加密，
+# 公钥运算的开销与负载大小无关，内存占用只和分块大小有关
+#
+#   头部 : MAGIC(4) | 版本(1) | 分块大小(4) | 封装密钥长度(2) | SM2 密文(SM4 密钥 16 || nonce 前缀 7)
+#   分块 : GCM 密文 || 标签(16)，IV = nonce 前缀(7) || 分块序号(4) || 是否最后一块(1)，头部作为附加数据
+# 最后一块带结束标志，截断或调换分块都会导致校验失败
+ENVELOPE_MAGIC = b'SM2E'
+ENVELOPE_VERSION = 1
+ENVELOPE_CHUNK = 64 * 1024
+# 分块大小上限，加密和解密两端都检查
+ENVELOPE_MAX_CHUNK = 16 * 1024 * 1024
+ENVELOPE_TAG = 16
+_ENVELOPE_HEAD = 4 + 1 + 4 + 2
+
+def _envelope_iv(prefix, index, final):
+    return prefix + index.to_bytes(4, 'big') + (b'\x01' if final else b'\x00')
+
+def _envelope_chunk_encrypt(key, prefix, index, final, header, data):
+    enc = GCMEncryptor(key, _envelope_iv(prefix, index, final), header)
+    ct = enc.update(data)
+    enc.finalize()
+    return ct + enc.tag
+
+# 流式加密：chunks 为任意长度字节串的可迭代对象，依次产出头部和各个密文分块
+def envelope_encrypt_stream(PB, chunks, chunk_size=ENVELOPE_CHUNK):
+    if not 0 < chunk_size <= ENVELOPE_MAX_CHUNK:
+        raise ValueError("分块大小错误！")
+    key = secrets.token_bytes(16)
+    prefix = secrets.token_bytes(7)
+    wrapped = sm2_encrypt(PB, key + prefix)
+    header = (ENVELOPE_MAGIC + bytes([ENVELOPE_VERSION]) + chunk_size.to_bytes(4, 'big')
+              + len(wrapped).to_bytes(2, 'big') + wrapped)
+    yield header
+
+    index = 0
+    buf = bytearray()
+    for piece in chunks:
+        buf += piece
+        # 缓冲区多于一个分块时，前面的分块一定不是最后一块
+        while len(buf) > chunk_size:
+            yield _envelope_chunk_encrypt(key, prefix, index, False, header, memoryview(buf)[:chunk_size])
+            del buf[:chunk_size]
+            index += 1
+    yield _envelope_chunk_encrypt(key, prefix, index, True, header, bytes(buf))
+
+# 流式解密：data 为密文字节串的可迭代对象，依次产出经过校验的明文分块
+def envelope_decrypt_stream(dB, data):
+    buf = bytearray()
+    it = iter(data)
+    header = None
+    key = prefix = None
+    chunk_size = 0
+    index = 0
+    for piece in it:
+        buf += piece
+        if header is None:
+            if len(buf) < _ENVELOPE_HEAD:
+                continue
+            if bytes(buf[:4]) != ENVELOPE_MAGIC or buf[4] != ENVELOPE_VERSION:
+                raise ValueError("数字信封格式错误！")
+            wrapped_len = int.from_bytes(buf[9:11], 'big')
+            if len(buf) < _ENVELOPE_HEAD + wrapped_len:
+                continue
+            header = bytes(buf[:_ENVELOPE_HEAD + wrapped_len])
+            # 头部在第一块的标签校验之前不可信，分块大小超过上限时直接拒绝，避免按伪造的大小缓存数据
+            chunk_size = int.from_bytes(header[5:9], 'big')
+            if not 0 < chunk_size <= ENVELOPE_MAX_CHUNK:
+                raise ValueError("数字信封分块大小错误！")
+            secret = sm2_decrypt(dB, header[_ENVELOPE_HEAD:])
+            if len(secret) != 23:
+                raise ValueError("数字信封格式错误！")
+            key, prefix = secret[:16], secret[16:]
+            del buf[:len(header)]
+        record = chunk_size + ENVELOPE_TAG
+        while len(buf) > record:
+            yield _envelope_chunk_decrypt(key, prefix, index, False, header, buf[:record])
+            del buf[:record]
+            index += 1
+    if header is None:
+        raise ValueError("数字信封不完整！")
+    if len(buf) < ENVELOPE_TAG:
+        raise ValueError("数字信封被截断！")
+    yield _envelope_chunk_decrypt(key, prefix, index, True, header, buf)
+
+def _envelope_chunk_decrypt(key, prefix, index, final, header, record):
+    dec = GCMDecryptor(key, _envelope_iv(prefix, index, final), record[-ENVELOPE_TAG:], header)
+    plain = dec.update(memoryview(record)[:-ENVELOPE_TAG])
+    try:
+        dec.finalize()
+    except ValueError:
+        raise ValueError(f"数字信封第 {index} 块校验失败，数据被篡改或截断！")
+    return plain
+
+# 按块读取文件
+def _read_chunks(f, size):
+    while True:
+        data = f.read(size)
+        if not data:
+            return
+        yield data
+
+def envelope_encrypt_file(PB, src_path, dst_path, chunk_size=ENVELOPE_CHUNK):
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        for out in envelope_encrypt_stream(PB, _read_chunks(src, chunk_size), chunk_size):
+            dst.write(out)
+
+# 解密到临时文件，全部校验通过后才替换目标文件
+def envelope_decrypt_file(dB, src_path, dst_path, read_size=ENVELOPE_CHUNK):
+    tmp = dst_path + '.part'
+    try:
+        with open(src_path, 'rb') as src, open(tmp, 'wb') as dst:
+            for out in envelope_decrypt_stream(dB, _read_chunks(src, read_size)):
+                dst.write(out)
+        os.replace(tmp, dst_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
 ######测试加密解密算法
 def test_sm2():
     print("==== 开始测试 SM2 加密与解密 ====\n")
@@ -275,14 +1146,63 @@ def test_sm2():
     print(f"明文消息（字节形式）: {M_bytes}\n")
 
     # 加密
-    complete_cipher = sm2_encrypt(PB, M_bytes)
+    complete_cipher = sm2_encrypt(PB, M_bytes, verbose=True)
     print("\n加密成功！密文：")
-    print(f"完整密文: {bits_to_hex(complete_cipher)}\n")
+    print(f"完整密文: {complete_cipher.hex()}\n")
 
     # 解密
-    decrypted_message_bytes = sm2_decrypt(dB, complete_cipher)
+    decrypted_message_bytes = sm2_decrypt(dB, complete_cipher, verbose=True)
     decrypted_message = decrypted_message_bytes.decode('ascii')
     print(f"\n解密成功！明文：{decrypted_message}\n")
 
-# 运行测试
-test_sm2()
\ No newline at end of file
+######标量乘各方法的一致性测试
+def test_point_mult(rounds=20):
+    for _ in range(rounds):
+        k = random.randint(1, n - 1)
+        P = point_mult_base(random.randint(1, n - 1))
+        expect = point_mult_affine(k, P)
+        for method in POINT_MULT_METHODS:
+            R = point_mult(k, P, method)
+            assert (R.x, R.y) == (expect.x, expect.y), method
+    for method in POINT_MULT_METHODS:
+        assert point_mult(n, G, method) is None, method
+        R = point_mult(n - 1, G, method)
+        assert (R.x, R.y) == (Gx, p - Gy), method
+    print("标量乘一致性测试通过")
+
+######性能测试：通用标量乘与固定基预计算表
+def benchmark_sm2(rounds=100):
+    print("==== SM2 性能测试 ====")
+    t = time.perf_counter()
+    get_g_table()
+    print(f"预计算表构造/加载: {time.perf_counter() - t:.3f} s")
+
+    scalars = [random.randint(1, n - 1) for _ in range(rounds)]
+    t = time.perf_counter()
+    for k in scalars:
+        point_mult(k, G)
+    generic = time.perf_counter() - t
+    t = time.perf_counter()
+    for k in scalars:
+        point_mult_base(k)
+    fixed = time.perf_counter() - t
+    print(f"密钥生成 [k]G: 通用 {generic / rounds * 1000:.2f} ms, 固定基 {fixed / rounds * 1000:.2f} ms, "
+          f"加速 {generic / fixed:.1f}x")
+
+    _, PB = generate_keypair()
+    M = b'benchmark message'
+    t = time.perf_counter()
+    for _ in range(rounds):
+        sm2_encrypt(PB, M)
+    enc = time.perf_counter() - t
+    print(f"加密: {enc / rounds * 1000:.2f} ms/次")
+
+# 运行测试，带参数 bench 时运行性能测试
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        benchmark_sm2()
+    elif len(sys.argv) > 1 and sys.argv[1] == 'check':
+        test_backends()
+        test_point_mult()
+    else:
+        test_sm2()
\ No newline at end of file
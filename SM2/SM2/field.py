@@ -0,0 +1,128 @@
+import os
+import random
+
+# SM2 的域运算后端。
+#
+# 后端实际决定的只有两件事：元素的整数类型（int 或 gmpy2.mpz）和模逆 inv()。
+# SM2 .py 中射影坐标公式和 batch_to_affine 的热路径为了速度直接写 x * y % FP，
+# 不经过 mul()/sqr()/reduce()（CPython 中每次方法调用的开销比一次 256 位乘法加取模还大）；
+# 这几个方法只用于 on_curve 等非热路径和交叉检验。
+# 若要接入真正改变乘法或约减方式的后端（如 Montgomery 表示），需要同时改写这些公式。
+
+# sm2p256v1 的素数 p = 2^256 - 2^224 - 2^96 + 2^64 - 1
+P = 0xFFFFFFFEFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF00000000FFFFFFFFFFFFFFFF
+_MASK256 = (1 << 256) - 1
+
+
+# 纯 Python 后端，元素就是 int
+class PythonField:
+    name = 'python'
+
+    def __init__(self, p=P):
+        self.p = p
+
+    def elem(self, x):
+        return x % self.p
+
+    def to_int(self, x):
+        return int(x)
+
+    def mul(self, x, y):
+        return x * y % self.p
+
+    def sqr(self, x):
+        return x * x % self.p
+
+    def inv(self, x):
+        return pow(x, -1, self.p)
+
+    # 利用 p 的特殊形式约减：2^256 ≡ 2^224 + 2^96 - 2^64 + 1 (mod p)，
+    # 把高位折叠回低 256 位，最后至多减一次 p。
+    # CPython 中 x % p 由 C 实现，对单次乘积反而更快，所以 mul/sqr 仍用 %，
+    # 该函数用于多个乘积累加后的宽整数
+    def reduce(self, x):
+        if self.p != P:
+            return x % self.p
+        neg = x < 0
+        if neg:
+            x = -x
+        while x >> 256:
+            hi = x >> 256
+            x = (x & _MASK256) + (hi << 224) + (hi << 96) - (hi << 64) + hi
+        if x >= P:
+            x -= P
+        if neg and x:
+            x = P - x
+        return x
+
+
+# gmpy2 后端，元素为 mpz，乘法、取模和求逆都由 GMP 完成
+class GmpyField:
+    name = 'gmpy2'
+
+    def __init__(self, p=P):
+        import gmpy2
+        self._gmpy2 = gmpy2
+        self.p = gmpy2.mpz(p)
+
+    def elem(self, x):
+        return self._gmpy2.mpz(x) % self.p
+
+    def to_int(self, x):
+        return int(x)
+
+    def mul(self, x, y):
+        return x * y % self.p
+
+    def sqr(self, x):
+        return x * x % self.p
+
+    def inv(self, x):
+        return self._gmpy2.invert(x, self.p)
+
+    def reduce(self, x):
+        return self._gmpy2.mpz(x) % self.p
+
+
+BACKENDS = {
+    'python': PythonField,
+    'gmpy2': GmpyField,
+}
+
+
+# 选择后端：优先使用参数，其次环境变量 SM2_FIELD_BACKEND，否则安装了 gmpy2 就用 gmpy2
+def get_backend(name=None):
+    name = name or os.environ.get('SM2_FIELD_BACKEND')
+    if name:
+        try:
+            return BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f"未知的域运算后端: {name}")
+    try:
+        return GmpyField()
+    except ImportError:
+        return PythonField()
+
+
+# 两个后端的交叉检验（gmpy2 未安装时只检验纯 Python 后端的特殊约减）
+def test_backends(rounds=1000):
+    py = PythonField()
+    backends = [py]
+    try:
+        backends.append(GmpyField())
+    except ImportError:
+        pass
+    samples = [0, 1, 2, P - 1, P - 2, (1 << 256) - 1]
+    samples += [random.randrange(P) for _ in range(rounds)]
+    for x in samples:
+        y = random.randrange(P)
+        wide = x * y * random.randrange(1 << 256) - random.randrange(1 << 300)
+        assert py.reduce(wide) == wide % P
+        for F in backends:
+            ex, ey = F.elem(x), F.elem(y)
+            assert F.to_int(F.mul(ex, ey)) == x * y % P, F.name
+            assert F.to_int(F.sqr(ex)) == x * x % P, F.name
+            assert F.to_int(F.reduce(wide)) == wide % P, F.name
+            if x % P:
+                assert F.to_int(F.mul(F.inv(ex), ex)) == 1, F.name
+    print(f"域运算后端交叉检验通过: {', '.join(F.name for F in backends)}")
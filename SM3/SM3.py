@@ -1,4 +1,11 @@
+import hashlib
 import struct
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:   # numpy 只在批量哈希时需要
+    np = None
 
 # IV初始值 
 IV = [
@@ -15,7 +22,9 @@ def left_rotate(n, m):
 
 # 填充函数，确保消息长度是 512 位的倍数
 def padding(message):
-    message = bytearray(message, 'utf-8')
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    message = bytearray(message)
     message_len = len(message) * 8  # 计算消息的位长度
     message.append(0x80)  # 添加' 1 '
 
@@ -24,7 +33,6 @@ def padding(message):
 
     # 添加原始消息长度的64位表示（以比特为单位）
     message += struct.pack('>Q', message_len)
-    print (message)
     return message
 
 # 消息扩展函数，将 512 位的消息扩展为 132 个 32 位字
@@ -75,6 +83,55 @@ def compress(V, B):
 
     # 更新 V 值
     return [(V[i] ^ var) & 0xFFFFFFFF for i, var in enumerate([A, B, C, D, E, F, G, H])]
+
+
+# 预先循环左移好的轮常量 T[j] <<< (j mod 32)，只计算一次
+T_ROT = [((T[j] << (j % 32)) | (T[j] >> (32 - j % 32))) & 0xFFFFFFFF for j in range(64)]
+
+# 快速压缩函数，结果与 compress 完全一致
+# 轮函数全部内联，0-15 轮和 16-63 轮分成两个循环，消息扩展写入预分配的列表
+def compress_fast(V, B):
+    W = [0] * 68
+    W[0:16] = struct.unpack('>16L', B)
+    for i in range(16, 68):
+        x = W[i - 16] ^ W[i - 9] ^ (((W[i - 3] << 15) | (W[i - 3] >> 17)) & 0xFFFFFFFF)
+        y = W[i - 13]
+        W[i] = (x ^ (((x << 15) | (x >> 17)) & 0xFFFFFFFF) ^ (((x << 23) | (x >> 9)) & 0xFFFFFFFF)
+                ^ (((y << 7) | (y >> 25)) & 0xFFFFFFFF) ^ W[i - 6])
+
+    A, B_, C, D, E, F, G, H = V
+    Tr = T_ROT
+    for j in range(16):
+        A12 = ((A << 12) | (A >> 20)) & 0xFFFFFFFF
+        SS1 = (A12 + E + Tr[j]) & 0xFFFFFFFF
+        SS1 = ((SS1 << 7) | (SS1 >> 25)) & 0xFFFFFFFF
+        TT1 = ((A ^ B_ ^ C) + D + (SS1 ^ A12) + (W[j] ^ W[j + 4])) & 0xFFFFFFFF
+        TT2 = ((E ^ F ^ G) + H + SS1 + W[j]) & 0xFFFFFFFF
+        D = C
+        C = ((B_ << 9) | (B_ >> 23)) & 0xFFFFFFFF
+        B_ = A
+        A = TT1
+        H = G
+        G = ((F << 19) | (F >> 13)) & 0xFFFFFFFF
+        F = E
+        E = TT2 ^ (((TT2 << 9) | (TT2 >> 23)) & 0xFFFFFFFF) ^ (((TT2 << 17) | (TT2 >> 15)) & 0xFFFFFFFF)
+    for j in range(16, 64):
+        A12 = ((A << 12) | (A >> 20)) & 0xFFFFFFFF
+        SS1 = (A12 + E + Tr[j]) & 0xFFFFFFFF
+        SS1 = ((SS1 << 7) | (SS1 >> 25)) & 0xFFFFFFFF
+        TT1 = (((A & B_) | (A & C) | (B_ & C)) + D + (SS1 ^ A12) + (W[j] ^ W[j + 4])) & 0xFFFFFFFF
+        TT2 = (((E & F) | (~E & G)) + H + SS1 + W[j]) & 0xFFFFFFFF
+        D = C
+        C = ((B_ << 9) | (B_ >> 23)) & 0xFFFFFFFF
+        B_ = A
+        A = TT1
+        H = G
+        G = ((F << 19) | (F >> 13)) & 0xFFFFFFFF
+        F = E
+        E = TT2 ^ (((TT2 << 9) | (TT2 >> 23)) & 0xFFFFFFFF) ^ (((TT2 << 17) | (TT2 >> 15)) & 0xFFFFFFFF)
+
+    return [V[0] ^ A, V[1] ^ B_, V[2] ^ C, V[3] ^ D, V[4] ^ E, V[5] ^ F, V[6] ^ G, V[7] ^ H]
+
 # 判断输入是普通字符串还是十六进制字符串
 def process_input(input_data):
     # 判断输入是否为十六进制字符串（只包含十六进制字符和空格）
@@ -89,21 +146,257 @@ def process_input(input_data):
     
     # 如果不是十六进制字符串，假设是普通字符串，转换为字节
     return bytearray(input_data, 'utf-8')
-# 计算 SM3 哈希值
+
+
+# 流式 SM3 哈希对象，接口与 hashlib 一致
+# 只缓存不足一个分组的尾部数据，内存占用与消息长度无关
+class SM3:
+    name = 'sm3'
+    digest_size = 32
+    block_size = 64
+
+    def __init__(self, data=b''):
+        self._V = list(IV)
+        self._buf = bytearray()   # 未满 64 字节的剩余数据
+        self._count = 0           # 已处理的消息字节数
+        if data:
+            self.update(data)
+
+    def update(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        data = memoryview(data).cast('B')
+        self._count += len(data)
+        V = self._V
+        pos = 0
+        # 先补满上次剩下的分组
+        if self._buf:
+            need = 64 - len(self._buf)
+            self._buf += data[:need]
+            pos = need
+            if len(self._buf) < 64:
+                return
+            V = compress_fast(V, bytes(self._buf))
+            self._buf.clear()
+        # 整分组直接从 memoryview 中压缩，不拷贝整个消息
+        end = len(data) - (len(data) - pos) % 64
+        for i in range(pos, end, 64):
+            V = compress_fast(V, data[i:i + 64])
+        self._buf += data[end:]
+        self._V = V
+
+    # 复制当前中间状态，用于共享前缀的分叉计算
+    def copy(self):
+        other = SM3.__new__(SM3)
+        other._V = list(self._V)
+        other._buf = bytearray(self._buf)
+        other._count = self._count
+        return other
+
+    def digest(self):
+        # 只对尾部缓冲做填充，不修改当前状态
+        tail = bytearray(self._buf)
+        tail.append(0x80)
+        tail.extend([0x00] * ((56 - len(tail) % 64) % 64))
+        tail += struct.pack('>Q', self._count * 8)
+        V = self._V
+        for i in range(0, len(tail), 64):
+            V = compress_fast(V, bytes(tail[i:i + 64]))
+        return b''.join(struct.pack('>L', x) for x in V)
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+# 计算 SM3 哈希值，message 可以是字符串或字节串
 def sm3_hash(message):
-    # 填充
-    padded_message = padding(message)
-    blocks = [padded_message[i:i + 64] for i in range(0, len(padded_message), 64)]
-    V = IV
+    return SM3(message).hexdigest()
+
+
+
+# 对 uint32 数组做循环左移
+def _rotl_np(x, m):
+    return (x << np.uint32(m)) | (x >> np.uint32(32 - m))
+
+
+# 向量化压缩函数：V 为 (8, N) 的状态，W 为 (16, N) 的消息字，N 条消息同时计算
+def _compress_np(V, W16):
+    N = W16.shape[1]
+    W = np.empty((68, N), dtype=np.uint32)
+    W[:16] = W16
+    for i in range(16, 68):
+        x = W[i - 16] ^ W[i - 9] ^ _rotl_np(W[i - 3], 15)
+        W[i] = x ^ _rotl_np(x, 15) ^ _rotl_np(x, 23) ^ _rotl_np(W[i - 13], 7) ^ W[i - 6]
+    W_ = W[:64] ^ W[4:68]
+
+    A, B, C, D, E, F, G, H = (V[i].copy() for i in range(8))
+    for j in range(64):
+        A12 = _rotl_np(A, 12)
+        SS1 = _rotl_np(A12 + E + np.uint32(T_ROT[j]), 7)
+        SS2 = SS1 ^ A12
+        if j < 16:
+            ff = A ^ B ^ C
+            gg = E ^ F ^ G
+        else:
+            ff = (A & B) | (A & C) | (B & C)
+            gg = (E & F) | (~E & G)
+        TT1 = ff + D + SS2 + W_[j]
+        TT2 = gg + H + SS1 + W[j]
+        D = C
+        C = _rotl_np(B, 9)
+        B = A
+        A = TT1
+        H = G
+        G = _rotl_np(F, 19)
+        F = E
+        E = TT2 ^ _rotl_np(TT2, 9) ^ _rotl_np(TT2, 17)
+    return V ^ np.stack([A, B, C, D, E, F, G, H])
+
+
+# 批量计算 SM3 哈希值，返回与 sm3_hash 相同的十六进制串列表
+# 按填充后的分组数把消息分组，每组内所有消息的消息扩展和 64 轮同时计算
+def sm3_hash_many(messages):
+    if np is None:
+        return [sm3_hash(m) for m in messages]
+    groups = {}
+    for idx, m in enumerate(messages):
+        padded = bytes(padding(m))
+        groups.setdefault(len(padded) // 64, []).append((idx, padded))
+
+    results = [None] * len(messages)
+    for nblocks, items in groups.items():
+        data = np.frombuffer(b''.join(p for _, p in items), dtype='>u4')
+        data = data.reshape(len(items), nblocks, 16).astype(np.uint32)
+        V = np.repeat(np.array(IV, dtype=np.uint32)[:, None], len(items), axis=1)
+        for k in range(nblocks):
+            V = _compress_np(V, np.ascontiguousarray(data[:, k, :].T))
+        digests = V.T.astype('>u4')
+        for row, (idx, _) in enumerate(items):
+            results[idx] = digests[row].tobytes().hex()
+    return results
+
+
+# HMAC 密钥和 KDF 前缀中间状态缓存的最大条目数
+MIDSTATE_CACHE_SIZE = 256
+
+
+# 计算 HMAC 的 ipad/opad 压缩后的中间状态
+def _hmac_pads(key):
+    if len(key) > SM3.block_size:
+        key = SM3(key).digest()
+    key = key.ljust(SM3.block_size, b'\x00')
+    inner = SM3(bytes(k ^ 0x36 for k in key))
+    outer = SM3(bytes(k ^ 0x5C for k in key))
+    return inner, outer
+
+
+# 按密钥做有界 LRU 缓存
+@lru_cache(maxsize=MIDSTATE_CACHE_SIZE)
+def _hmac_midstates(key):
+    return _hmac_pads(key)
+
+
+# HMAC-SM3 对象，接口与 hmac 模块一致；同一密钥重复计算时只需压缩新的消息分组
+class HMAC_SM3:
+    digest_size = SM3.digest_size
+    block_size = SM3.block_size
+    name = 'hmac-sm3'
+
+    def __init__(self, key, msg=None):
+        inner, outer = _hmac_midstates(bytes(key))
+        self._inner = inner.copy()
+        self._outer = outer
+        if msg is not None:
+            self.update(msg)
+
+    def update(self, msg):
+        self._inner.update(msg)
+
+    def copy(self):
+        other = HMAC_SM3.__new__(HMAC_SM3)
+        other._inner = self._inner.copy()
+        other._outer = self._outer
+        return other
+
+    def digest(self):
+        h = self._outer.copy()
+        h.update(self._inner.digest())
+        return h.digest()
+
+    def hexdigest(self):
+        return self.digest().hex()
+
+
+# 一次性计算 HMAC-SM3，返回 32 字节
+def hmac_sm3(key, msg):
+    return HMAC_SM3(key, msg).digest()
+
+
+# 缓存共享前缀 Z 压缩后的中间状态
+@lru_cache(maxsize=MIDSTATE_CACHE_SIZE)
+def _kdf_midstate(Z):
+    return SM3(Z)
+
+
+# SM3 密钥派生函数 KDF(Z, klen)，klen 为输出的字节数
+# 每个计数器只需从 Z 的中间状态继续压缩 ct 所在的最后分组
+def sm3_kdf(Z, klen):
+    if klen >= (2 ** 32 - 1) * 32:
+        raise ValueError("密钥派生函数KDF出错，请检查klen的大小！")
+    base = _kdf_midstate(bytes(Z))
+    out = bytearray()
+    ct = 1
+    while len(out) < klen:
+        h = base.copy()
+        h.update(struct.pack('>L', ct))
+        out += h.digest()
+        ct += 1
+    return bytes(out[:klen])
+
+# 迭代中 HMAC 的消息固定为 32 字节，内外两次哈希都只剩一个分组：
+# 32 字节数据 || 0x80 || 0 填充 || 总长度 (64 + 32) * 8 比特
+_PBKDF2_TAIL = b'\x80' + bytes(23) + struct.pack('>Q', (64 + 32) * 8)
+# OpenSSL 提供 SM3 时 hashlib.pbkdf2_hmac 可直接计算，速度快两个数量级
+HASHLIB_SM3 = 'sm3' in hashlib.algorithms_available
+
+
+# 纯 Python 实现，每次迭代只需两次压缩
+def _pbkdf2_python(password, salt, iterations, dklen):
+    # 口令不进入 HMAC 中间状态缓存，避免在内存中长期保留
+    inner, outer = _hmac_pads(password)
+    Vi, Vo = inner._V, outer._V
+    tail = _PBKDF2_TAIL
+    out = bytearray()
+    for block in range(1, -(-dklen // 32) + 1):
+        h = inner.copy()
+        h.update(salt + struct.pack('>L', block))
+        o = outer.copy()
+        o.update(h.digest())
+        u = o.digest()
+        acc = int.from_bytes(u, 'big')
+        for _ in range(iterations - 1):
+            u = struct.pack('>8L', *compress_fast(Vi, u + tail))
+            u = struct.pack('>8L', *compress_fast(Vo, u + tail))
+            acc ^= int.from_bytes(u, 'big')
+        out += acc.to_bytes(32, 'big')
+    return bytes(out[:dklen])
 
-    # 压缩
-    for block in blocks:
-        V = compress(V, block)
 
-    # 将最终结果 V 转换为 16 进制字符串
-    return ''.join(f'{x:08x}' for x in V)
+# PBKDF2-HMAC-SM3（RFC 8018），接口与 hashlib.pbkdf2_hmac 一致
+def pbkdf2_hmac_sm3(password, salt, iterations, dklen=None):
+    if isinstance(password, str):
+        password = password.encode('utf-8')
+    if isinstance(salt, str):
+        salt = salt.encode('utf-8')
+    if iterations < 1:
+        raise ValueError("迭代次数必须是正整数！")
+    dklen = dklen or SM3.digest_size
+    if HASHLIB_SM3:
+        return hashlib.pbkdf2_hmac('sm3', password, salt, iterations, dklen)
+    return _pbkdf2_python(bytes(password), bytes(salt), iterations, dklen)
 
 
-message = input("输入要加密的消息:")
-result = sm3_hash(message)
-print(f"SM3 哈希值: {result}")
\ No newline at end of file
+if __name__ == "__main__":
+    message = input("输入要加密的消息:")
+    result = sm3_hash(message)
+    print(f"SM3 哈希值: {result}")
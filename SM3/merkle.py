@@ -0,0 +1,250 @@
+import argparse
+import json
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from SM3 import SM3
+
+# 默认分块大小 1 MiB，是 mmap 分配粒度的整数倍
+CHUNK_SIZE = 1 << 20
+# 每个进程任务处理的分块数，减少进程间通信次数
+LEAVES_PER_TASK = 16
+MANIFEST_SUFFIX = '.sm3tree'
+
+# 叶子和内部节点使用不同前缀，防止第二原像攻击
+LEAF_PREFIX = b'\x00'
+NODE_PREFIX = b'\x01'
+
+
+# 计算一个叶子分块的哈希
+def leaf_hash(chunk):
+    h = SM3(LEAF_PREFIX)
+    h.update(chunk)
+    return h.digest()
+
+
+# 计算内部节点的哈希
+def node_hash(left, right):
+    return SM3(NODE_PREFIX + left + right).digest()
+
+
+# 进程池任务：从内存映射的文件中计算若干个叶子哈希
+def _hash_leaves(path, chunk_size, indices):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return [(i, leaf_hash(b'')) for i in indices]
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            view = memoryview(mm)
+            try:
+                return [(i, leaf_hash(view[i * chunk_size:(i + 1) * chunk_size])) for i in indices]
+            finally:
+                view.release()
+
+
+# 文件的分块个数，空文件视为一个空分块
+def leaf_count(size, chunk_size=CHUNK_SIZE):
+    return max(1, -(-size // chunk_size))
+
+
+# 由叶子层逐层构造整棵树，奇数个节点时最后一个直接提升到上一层
+def build_levels(leaves):
+    levels = [list(leaves)]
+    while len(levels[-1]) > 1:
+        cur = levels[-1]
+        nxt = [node_hash(cur[i], cur[i + 1]) for i in range(0, len(cur) - 1, 2)]
+        if len(cur) % 2:
+            nxt.append(cur[-1])
+        levels.append(nxt)
+    return levels
+
+
+# 只重新计算 dirty 叶子到根路径上的节点
+def update_path(levels, dirty):
+    dirty = set(dirty)
+    for depth in range(1, len(levels)):
+        below = levels[depth - 1]
+        parents = set()
+        for i in dirty:
+            p = i // 2
+            if 2 * p + 1 < len(below):
+                levels[depth][p] = node_hash(below[2 * p], below[2 * p + 1])
+            else:
+                levels[depth][p] = below[2 * p]
+            parents.add(p)
+        dirty = parents
+    return levels
+
+
+class MerkleTree:
+    def __init__(self, path, chunk_size=CHUNK_SIZE, levels=None, size=None, mtime_ns=None):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.levels = levels or []
+        self.size = size
+        self.mtime_ns = mtime_ns
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def hexroot(self):
+        return self.root.hex()
+
+    # 清单文件保存每一层的节点哈希以及文件大小和修改时间
+    def save(self, manifest_path=None):
+        manifest_path = manifest_path or self.path + MANIFEST_SUFFIX
+        data = {
+            'chunk_size': self.chunk_size,
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'levels': [[h.hex() for h in level] for level in self.levels],
+        }
+        tmp = manifest_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, manifest_path)
+
+    @classmethod
+    def load(cls, path, manifest_path=None):
+        manifest_path = manifest_path or path + MANIFEST_SUFFIX
+        with open(manifest_path) as f:
+            data = json.load(f)
+        levels = [[bytes.fromhex(h) for h in level] for level in data['levels']]
+        return cls(path, data['chunk_size'], levels, data['size'], data['mtime_ns'])
+
+
+# 把需要计算的叶子分成任务提交到进程池，返回 {叶子序号: 哈希}
+def _submit_leaves(pool, path, chunk_size, indices):
+    indices = sorted(indices)
+    return [pool.submit(_hash_leaves, path, chunk_size, indices[i:i + LEAVES_PER_TASK])
+            for i in range(0, len(indices), LEAVES_PER_TASK)]
+
+
+def _collect(futures):
+    hashes = {}
+    for fut in futures:
+        hashes.update(fut.result())
+    return hashes
+
+
+# 计算整个文件的 Merkle 树
+def hash_file(path, chunk_size=CHUNK_SIZE, pool=None, workers=None):
+    st = os.stat(path)
+    n = leaf_count(st.st_size, chunk_size)
+    own_pool = pool is None
+    pool = pool or ProcessPoolExecutor(workers)
+    try:
+        hashes = _collect(_submit_leaves(pool, path, chunk_size, range(n)))
+    finally:
+        if own_pool:
+            pool.shutdown()
+    levels = build_levels([hashes[i] for i in range(n)])
+    return MerkleTree(path, chunk_size, levels, st.st_size, st.st_mtime_ns)
+
+
+# 分块序号集合：字节区间 (offset, length) 覆盖到的所有分块
+def chunks_for_ranges(ranges, chunk_size=CHUNK_SIZE):
+    dirty = set()
+    for offset, length in ranges:
+        first = offset // chunk_size
+        last = (offset + max(length, 1) - 1) // chunk_size
+        dirty.update(range(first, last + 1))
+    return dirty
+
+
+# 增量更新：只重新计算被修改区间对应的叶子及其到根的路径
+# 没有给出修改区间时，若大小和修改时间都没变则直接复用清单，否则全部重算
+def rehash_file(tree, ranges=None, pool=None, workers=None):
+    st = os.stat(tree.path)
+    if ranges is None:
+        if st.st_size == tree.size and st.st_mtime_ns == tree.mtime_ns:
+            return tree
+        return hash_file(tree.path, tree.chunk_size, pool, workers)
+
+    old_n = len(tree.levels[0])
+    n = leaf_count(st.st_size, tree.chunk_size)
+    dirty = {i for i in chunks_for_ranges(ranges, tree.chunk_size) if i < n}
+    if st.st_size != tree.size:
+        # 文件长度变化时原来的最后一个分块和新增分块都要重新计算
+        dirty.update(range(min(old_n, n) - 1, n))
+
+    own_pool = pool is None
+    pool = pool or ProcessPoolExecutor(workers)
+    try:
+        hashes = _collect(_submit_leaves(pool, tree.path, tree.chunk_size, dirty))
+    finally:
+        if own_pool:
+            pool.shutdown()
+
+    leaves = tree.levels[0][:n]
+    for i, h in hashes.items():
+        if i < len(leaves):
+            leaves[i] = h
+        else:
+            leaves.append(h)
+    if n == old_n:
+        tree.levels[0] = leaves
+        update_path(tree.levels, dirty)
+    else:
+        # 叶子个数变化后树的形状不同，内部节点只需按叶子重新拼接
+        tree.levels = build_levels(leaves)
+    tree.size = st.st_size
+    tree.mtime_ns = st.st_mtime_ns
+    return tree
+
+
+# 展开命令行给出的文件和目录
+def iter_files(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, _, filenames in os.walk(p):
+                for name in sorted(filenames):
+                    if not name.endswith(MANIFEST_SUFFIX):
+                        yield os.path.join(dirpath, name)
+        else:
+            yield p
+
+
+# 多个文件共享一个进程池，所有文件的叶子任务同时提交
+def hash_many(paths, chunk_size=CHUNK_SIZE, workers=None, use_manifest=False):
+    files = list(iter_files(paths))
+    trees = {}
+    pending = {}
+    with ProcessPoolExecutor(workers) as pool:
+        for path in files:
+            if use_manifest and os.path.exists(path + MANIFEST_SUFFIX):
+                tree = MerkleTree.load(path)
+                st = os.stat(path)
+                if tree.chunk_size == chunk_size and st.st_size == tree.size \
+                        and st.st_mtime_ns == tree.mtime_ns:
+                    trees[path] = tree
+                    continue
+            st = os.stat(path)
+            n = leaf_count(st.st_size, chunk_size)
+            pending[path] = (st, n, _submit_leaves(pool, path, chunk_size, range(n)))
+        for path, (st, n, futures) in pending.items():
+            hashes = _collect(futures)
+            levels = build_levels([hashes[i] for i in range(n)])
+            trees[path] = MerkleTree(path, chunk_size, levels, st.st_size, st.st_mtime_ns)
+            if use_manifest:
+                trees[path].save()
+    return [(path, trees[path]) for path in files]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并行计算文件的 SM3 Merkle 树根哈希')
+    parser.add_argument('paths', nargs='+', help='文件或目录')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='工作进程数')
+    parser.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE, help='分块大小（字节）')
+    parser.add_argument('-m', '--manifest', action='store_true',
+                        help='读取/写入 .sm3tree 清单，未修改的文件不再重新计算')
+    args = parser.parse_args(argv)
+
+    for path, tree in hash_many(args.paths, args.chunk_size, args.workers, args.manifest):
+        print(f'{tree.hexroot()}  {path}')
+
+
+if __name__ == '__main__':
+    main()
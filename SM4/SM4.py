@@ -1,6 +1,11 @@
-import tkinter as tk
-from tkinter import messagebox
-from Crypto.Util.Padding import pad
+import struct
+from array import array
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:   # numpy 只用于批量加解密
+    np = None
 # Constants and helper functions for SM4 encryption
 FK = [0xa3b1bac6, 0x56aa3350, 0x677d9197, 0xb27022dc]
 S_BOX = [0xD6, 0x90, 0xE9, 0xFE, 0xCC, 0xE1, 0x3D, 0xB7, 0x16, 0xB6, 0x14, 0xC2, 0x28, 0xFB, 0x2C, 0x05,
@@ -50,12 +55,18 @@ def T(x1, x2, x3, rk):
     b = search_s(a)
     return b ^ left(b, 2) ^ left(b, 10) ^ left(b, 18) ^ left(b, 24)
 
+# 密钥扩展使用的 T' 变换，线性部分为 L'
+def rT(k1, k2, k3, ck):
+    a = k1 ^ k2 ^ k3 ^ ck
+    b = search_s(a)
+    return b ^ left(b, 13) ^ left(b, 23)
+
 def extend(mk):
     MK = [(mk >> (128 - (i + 1) * 32)) & 0xffffffff for i in range(4)]
     K = [MK[i] ^ FK[i] for i in range(4)]
     rk = []
     for i in range(32):
-        a = T(K[i + 1], K[i + 2], K[i + 3], CK[i])
+        a = rT(K[i + 1], K[i + 2], K[i + 3], CK[i])
         K.append(K[i] ^ a)
         rk.append(K[i] ^ a)
     return rk
@@ -75,6 +86,287 @@ def decode(ciphertext, rk):
         X = X[1:] + [t ^ X[0]]
     return ''.join([f"{X[3 - i]:08x}" for i in range(4)])
 
+# 合并了 S 盒与线性变换 L 的查找表：T(x) = TBL0[x>>24] ^ TBL1[..] ^ TBL2[..] ^ TBL3[x&0xff]
+def _make_tables():
+    tables = []
+    for shift in (24, 16, 8, 0):
+        tbl = []
+        for i in range(256):
+            b = S_BOX[i] << shift
+            tbl.append(b ^ left(b, 2) ^ left(b, 10) ^ left(b, 18) ^ left(b, 24))
+        tables.append(tbl)
+    return tables
+
+TBL0, TBL1, TBL2, TBL3 = _make_tables()
+
+# 对 buf[off:off+16] 原地做 32 轮变换，rk 为加密或逆序的解密轮密钥
+def crypt_block(buf, off, rk):
+    t0, t1, t2, t3 = TBL0, TBL1, TBL2, TBL3
+    x0, x1, x2, x3 = struct.unpack_from('>4I', buf, off)
+    for i in range(0, 32, 4):
+        a = x1 ^ x2 ^ x3 ^ rk[i]
+        x0 ^= t0[a >> 24] ^ t1[(a >> 16) & 0xff] ^ t2[(a >> 8) & 0xff] ^ t3[a & 0xff]
+        a = x2 ^ x3 ^ x0 ^ rk[i + 1]
+        x1 ^= t0[a >> 24] ^ t1[(a >> 16) & 0xff] ^ t2[(a >> 8) & 0xff] ^ t3[a & 0xff]
+        a = x3 ^ x0 ^ x1 ^ rk[i + 2]
+        x2 ^= t0[a >> 24] ^ t1[(a >> 16) & 0xff] ^ t2[(a >> 8) & 0xff] ^ t3[a & 0xff]
+        a = x0 ^ x1 ^ x2 ^ rk[i + 3]
+        x3 ^= t0[a >> 24] ^ t1[(a >> 16) & 0xff] ^ t2[(a >> 8) & 0xff] ^ t3[a & 0xff]
+    struct.pack_into('>4I', buf, off, x3, x2, x1, x0)
+
+# 批量加解密：blocks 为 (N, 4) 的 uint32 数组，N 个分组的每一轮同时计算
+# 轮函数用合并表 TBL0..TBL3 做查表，返回新的 (N, 4) 数组
+def sm4_crypt_np(blocks, rk):
+    t0, t1, t2, t3 = _NP_TABLES
+    X = [blocks[:, i].astype(np.uint32) for i in range(4)]
+    for i in range(32):
+        a = X[1] ^ X[2] ^ X[3] ^ np.uint32(rk[i])
+        X[0] ^= t0[a >> 24] ^ t1[(a >> 16) & 0xff] ^ t2[(a >> 8) & 0xff] ^ t3[a & 0xff]
+        X = X[1:] + X[:1]
+    return np.stack([X[3], X[2], X[1], X[0]], axis=1)
+
+_NP_TABLES = tuple(np.array(t, dtype=np.uint32) for t in (TBL0, TBL1, TBL2, TBL3)) if np is not None else None
+
+# 分组数不少于该值时使用 numpy 批量路径
+NP_MIN_BLOCKS = 64
+
+# 对整个缓冲区原地做批量变换
+def _crypt_blocks_np(buf, rk):
+    blocks = np.frombuffer(buf, dtype='>u4').reshape(-1, 4)
+    buf[:] = sm4_crypt_np(blocks, rk).astype('>u4').tobytes()
+
+# 轮密钥缓存的最大密钥个数
+KEY_CACHE_SIZE = 1024
+
+# 密钥扩展结果：加密轮密钥和逆序的解密轮密钥，用紧凑的 array('I') 存储
+class KeySchedule:
+    __slots__ = ('enc', 'dec')
+
+    def __init__(self, key):
+        rk = extend(int.from_bytes(key, 'big'))
+        self.enc = array('I', rk)
+        self.dec = array('I', rk[::-1])
+
+# 按密钥字节缓存密钥扩展结果，重复使用同一密钥时不再扩展
+# lru_cache 是线程安全的，命中/未命中次数见 key_cache_info()
+@lru_cache(maxsize=KEY_CACHE_SIZE)
+def key_schedule(key):
+    return KeySchedule(key)
+
+def key_cache_info():
+    return key_schedule.cache_info()
+
+def key_cache_clear():
+    key_schedule.cache_clear()
+
+# 面向字节的 SM4，密钥为 16 字节，直接在 bytearray/memoryview 中原地加解密
+class SM4:
+    block_size = 16
+
+    def __init__(self, key):
+        if len(key) != 16:
+            raise ValueError("SM4 密钥长度必须为 16 字节！")
+        ks = key_schedule(bytes(key))
+        self.rk = ks.enc
+        self.rk_dec = ks.dec
+
+    # 原地加密 buf 中从 off 开始的一个分组
+    def encrypt_block(self, buf, off=0):
+        crypt_block(buf, off, self.rk)
+
+    def decrypt_block(self, buf, off=0):
+        crypt_block(buf, off, self.rk_dec)
+
+    # 原地加密 buf 中的所有分组，长度必须是 16 的倍数
+    def encrypt_blocks(self, buf):
+        if len(buf) % 16:
+            raise ValueError("数据长度必须是 16 字节的整数倍！")
+        rk = self.rk
+        if np is not None and len(buf) >= NP_MIN_BLOCKS * 16:
+            _crypt_blocks_np(buf, rk)
+            return
+        for off in range(0, len(buf), 16):
+            crypt_block(buf, off, rk)
+
+    def decrypt_blocks(self, buf):
+        if len(buf) % 16:
+            raise ValueError("数据长度必须是 16 字节的整数倍！")
+        rk = self.rk_dec
+        if np is not None and len(buf) >= NP_MIN_BLOCKS * 16:
+            _crypt_blocks_np(buf, rk)
+            return
+        for off in range(0, len(buf), 16):
+            crypt_block(buf, off, rk)
+
+    # 加密一个 16 字节分组，返回新的字节串
+    def encrypt(self, block):
+        buf = bytearray(block)
+        crypt_block(buf, 0, self.rk)
+        return bytes(buf)
+
+    def decrypt(self, block):
+        buf = bytearray(block)
+        crypt_block(buf, 0, self.rk_dec)
+        return bytes(buf)
+
+# PKCS#7 填充
+def pkcs7_pad(data, block_size=16):
+    n = block_size - len(data) % block_size
+    return bytes(data) + bytes([n]) * n
+
+def pkcs7_unpad(data, block_size=16):
+    if not data or len(data) % block_size:
+        raise ValueError("填充错误：数据长度不是分组长度的整数倍！")
+    n = data[-1]
+    if n < 1 or n > block_size or data[-n:] != bytes([n]) * n:
+        raise ValueError("填充错误：PKCS#7 填充不正确！")
+    return bytes(data[:-n])
+
+# 两个等长字节串异或
+def xor_bytes(a, b):
+    return (int.from_bytes(a, 'big') ^ int.from_bytes(b, 'big')).to_bytes(len(a), 'big')
+
+MODES = ('ECB', 'CBC', 'CTR')
+
+# 生成从 counter 开始的 nblocks 个分组的 CTR 密钥流
+def ctr_keystream(cipher, counter, nblocks):
+    buf = bytearray(nblocks * 16)
+    for i in range(nblocks):
+        buf[i * 16:(i + 1) * 16] = ((counter + i) & (2 ** 128 - 1)).to_bytes(16, 'big')
+    cipher.encrypt_blocks(buf)
+    return buf
+
+# 流式加解密对象的公共部分：update() 返回已能输出的数据，finalize() 输出剩余部分
+class _StreamMode:
+    def __init__(self, key, mode='CBC', iv=None, padding=True):
+        mode = mode.upper()
+        if mode not in MODES:
+            raise ValueError(f"不支持的工作模式：{mode}")
+        if mode != 'ECB' and (iv is None or len(iv) != 16):
+            raise ValueError("CBC/CTR 模式需要 16 字节的 IV！")
+        self.cipher = key if isinstance(key, SM4) else SM4(key)
+        self.mode = mode
+        self.padding = padding and mode != 'CTR'
+        self._buf = bytearray()
+        self._finalized = False
+        if mode == 'CBC':
+            self._prev = struct.unpack('>4I', iv)
+        elif mode == 'CTR':
+            self._counter = int.from_bytes(iv, 'big')
+            self._keystream = b''
+
+    def _check(self):
+        if self._finalized:
+            raise ValueError("finalize() 之后不能再调用 update()！")
+
+    # CTR 模式加密解密相同：用剩余的密钥流和新生成的密钥流异或
+    def _ctr(self, data):
+        out = bytearray()
+        if self._keystream:
+            n = min(len(data), len(self._keystream))
+            out += xor_bytes(data[:n], self._keystream[:n])
+            self._keystream = self._keystream[n:]
+            data = data[n:]
+        if data:
+            nblocks = -(-len(data) // 16)
+            ks = ctr_keystream(self.cipher, self._counter, nblocks)
+            self._counter += nblocks
+            out += xor_bytes(data, ks[:len(data)])
+            self._keystream = bytes(ks[len(data):])
+        return bytes(out)
+
+class SM4Encryptor(_StreamMode):
+    def _process(self, buf):
+        if self.mode == 'ECB':
+            self.cipher.encrypt_blocks(buf)
+            return
+        rk = self.cipher.rk
+        p0, p1, p2, p3 = self._prev
+        for off in range(0, len(buf), 16):
+            x0, x1, x2, x3 = struct.unpack_from('>4I', buf, off)
+            struct.pack_into('>4I', buf, off, x0 ^ p0, x1 ^ p1, x2 ^ p2, x3 ^ p3)
+            crypt_block(buf, off, rk)
+            p0, p1, p2, p3 = struct.unpack_from('>4I', buf, off)
+        self._prev = (p0, p1, p2, p3)
+
+    def update(self, data):
+        self._check()
+        if self.mode == 'CTR':
+            return self._ctr(memoryview(data).cast('B'))
+        self._buf += data
+        end = len(self._buf) - len(self._buf) % 16
+        out = self._buf[:end]
+        del self._buf[:end]
+        self._process(out)
+        return bytes(out)
+
+    def finalize(self):
+        self._check()
+        self._finalized = True
+        if self.mode == 'CTR':
+            return b''
+        if self.padding:
+            out = bytearray(pkcs7_pad(self._buf))
+        elif self._buf:
+            raise ValueError("未使用填充时数据长度必须是 16 字节的整数倍！")
+        else:
+            return b''
+        self._process(out)
+        return bytes(out)
+
+class SM4Decryptor(_StreamMode):
+    def _process(self, buf):
+        if self.mode == 'ECB':
+            self.cipher.decrypt_blocks(buf)
+            return
+        rk = self.cipher.rk_dec
+        p0, p1, p2, p3 = self._prev
+        for off in range(0, len(buf), 16):
+            c = struct.unpack_from('>4I', buf, off)
+            crypt_block(buf, off, rk)
+            x0, x1, x2, x3 = struct.unpack_from('>4I', buf, off)
+            struct.pack_into('>4I', buf, off, x0 ^ p0, x1 ^ p1, x2 ^ p2, x3 ^ p3)
+            p0, p1, p2, p3 = c
+        self._prev = (p0, p1, p2, p3)
+
+    def update(self, data):
+        self._check()
+        if self.mode == 'CTR':
+            return self._ctr(memoryview(data).cast('B'))
+        self._buf += data
+        end = len(self._buf) - len(self._buf) % 16
+        # 使用填充时保留最后一个完整分组，留给 finalize() 去填充
+        if self.padding and end == len(self._buf):
+            end -= 16
+        if end <= 0:
+            return b''
+        out = self._buf[:end]
+        del self._buf[:end]
+        self._process(out)
+        return bytes(out)
+
+    def finalize(self):
+        self._check()
+        self._finalized = True
+        if self.mode == 'CTR':
+            return b''
+        if len(self._buf) % 16:
+            raise ValueError("密文长度必须是 16 字节的整数倍！")
+        out = self._buf
+        self._process(out)
+        if self.padding:
+            return pkcs7_unpad(out)
+        return bytes(out)
+
+# 一次性加密/解密整段数据
+def sm4_encrypt(key, data, mode='CBC', iv=None, padding=True):
+    enc = SM4Encryptor(key, mode, iv, padding)
+    return enc.update(data) + enc.finalize()
+
+def sm4_decrypt(key, data, mode='CBC', iv=None, padding=True):
+    dec = SM4Decryptor(key, mode, iv, padding)
+    return dec.update(data) + dec.finalize()
+
 # Main Function
 if __name__ == "__main__":
     plaintext = input("请输入明文（16进制）：")
@@ -0,0 +1,212 @@
+import mmap
+import os
+import struct
+import sys
+
+from SM4 import SM4, xor_bytes
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SM3'))
+from SM3 import HMAC_SM3, sm3_kdf  # noqa: E402
+
+# 分块随机访问加密容器
+#
+#   头部   : MAGIC(4) | 版本(1) | 保留(3) | 分块大小(4) | nonce(8)
+#   数据   : 每个分块的 SM4-CTR 密文，依次存放
+#   索引   : 每个分块一项 偏移(8) | 长度(4) | HMAC-SM3 标签(32)
+#   尾部   : 索引偏移(8) | 分块数(8) | 明文长度(8) | 标签(32) | MAGIC(4)
+#
+# 尾部标签覆盖 头部 || 索引 || 索引偏移 || 分块数 || 明文长度，读取时还会检查这些字段互相一致。
+#
+# 第 i 个分块的 CTR 计数器基值为 nonce || i || 0，分块内第 j 个分组的计数器为基值 + j，
+# 因此读取任意区间时只需解密覆盖它的分组。
+MAGIC = b'SM4C'
+VERSION = 2
+CHUNK_SIZE = 64 * 1024
+HEADER = struct.Struct('>4sB3xI8s')
+INDEX_ENTRY = struct.Struct('>QI32s')
+TRAILER = struct.Struct('>QQQ32s4s')
+TRAILER_FIELDS = struct.Struct('>QQQ')
+
+
+# 尾部标签：HMAC-SM3(头部 || 索引 || 索引偏移 || 分块数 || 明文长度)
+def footer_tag(mkey, header, index, index_off, count, size):
+    h = HMAC_SM3(mkey, header)
+    h.update(index)
+    h.update(TRAILER_FIELDS.pack(index_off, count, size))
+    return h.digest()
+
+
+# 由 SM4 密钥派生计算分块标签的 MAC 密钥
+def mac_key(key):
+    return sm3_kdf(b'SM4C-MAC' + bytes(key), 32)
+
+
+# 第 index 个分块的计数器基值
+def chunk_counter(nonce, index):
+    return (int.from_bytes(nonce, 'big') << 64) | (index << 32)
+
+
+# 分块标签：HMAC-SM3(nonce || 分块序号 || 密文)
+def chunk_tag(mkey, nonce, index, ciphertext):
+    h = HMAC_SM3(mkey, nonce + struct.pack('>Q', index))
+    h.update(ciphertext)
+    return h.digest()
+
+
+# 对 data 从分块内第 block 个分组开始做 CTR 变换，ctr_buf 为可复用的计数器缓冲区
+def _ctr_xor(cipher, counter, data, ctr_buf):
+    nblocks = -(-len(data) // 16)
+    if len(ctr_buf) < nblocks * 16:
+        ctr_buf.extend(bytes(nblocks * 16 - len(ctr_buf)))
+    ks = memoryview(ctr_buf)[:nblocks * 16]
+    for i in range(nblocks):
+        ks[i * 16:(i + 1) * 16] = (counter + i).to_bytes(16, 'big')
+    cipher.encrypt_blocks(ks)
+    out = xor_bytes(data, ks[:len(data)])
+    ks.release()
+    return out
+
+
+# 加密 src_path 到容器文件 dst_path，输入和输出都使用 mmap
+def encrypt_file(src_path, dst_path, key, chunk_size=CHUNK_SIZE, nonce=None):
+    if chunk_size <= 0 or chunk_size % 16:
+        raise ValueError("分块大小必须是 16 的正整数倍！")
+    cipher = SM4(key)
+    mkey = mac_key(key)
+    nonce = nonce or os.urandom(8)
+    size = os.path.getsize(src_path)
+    count = -(-size // chunk_size)
+    index_off = HEADER.size + size
+    total = index_off + count * INDEX_ENTRY.size + TRAILER.size
+    header = HEADER.pack(MAGIC, VERSION, chunk_size, nonce)
+
+    with open(src_path, 'rb') as src, open(dst_path, 'w+b') as dst:
+        dst.truncate(total)
+        with mmap.mmap(dst.fileno(), total) as out:
+            out[:HEADER.size] = header
+            index = bytearray()
+            ctr_buf = bytearray()
+            if size:
+                with mmap.mmap(src.fileno(), 0, access=mmap.ACCESS_READ) as inp:
+                    view = memoryview(inp)
+                    for i in range(count):
+                        start = i * chunk_size
+                        end = min(start + chunk_size, size)
+                        ct = _ctr_xor(cipher, chunk_counter(nonce, i), view[start:end], ctr_buf)
+                        out[HEADER.size + start:HEADER.size + end] = ct
+                        index += INDEX_ENTRY.pack(HEADER.size + start, end - start,
+                                                  chunk_tag(mkey, nonce, i, ct))
+                    view.release()
+            out[index_off:index_off + len(index)] = index
+            tag = footer_tag(mkey, header, index, index_off, count, size)
+            out[total - TRAILER.size:] = TRAILER.pack(index_off, count, size, tag, MAGIC)
+            out.flush()
+
+
+# 容器读取对象，read(offset, length) 只解密并校验覆盖该区间的分块
+class ContainerReader:
+    def __init__(self, path, key):
+        self.cipher = SM4(key)
+        self.mkey = mac_key(key)
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("容器文件格式错误！")
+        self._ctr_buf = bytearray()
+        self._pos = 0
+        try:
+            self._load_index()
+        except Exception:
+            self.close()
+            raise
+
+    def _load_index(self):
+        mm = self._mm
+        if len(mm) < HEADER.size + TRAILER.size:
+            raise ValueError("容器文件格式错误！")
+        magic, version, self.chunk_size, self.nonce = HEADER.unpack_from(mm, 0)
+        index_off, count, self.size, tag, end_magic = TRAILER.unpack_from(mm, len(mm) - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC or version != VERSION or not self.chunk_size:
+            raise ValueError("容器文件格式错误！")
+        # 先检查尾部字段与文件长度一致，再做校验
+        if index_off != HEADER.size + self.size or index_off + count * INDEX_ENTRY.size + TRAILER.size != len(mm):
+            raise ValueError("容器文件格式错误！")
+        index = mm[index_off:index_off + count * INDEX_ENTRY.size]
+        if footer_tag(self.mkey, mm[:HEADER.size], index, index_off, count, self.size) != tag:
+            raise ValueError("容器索引校验失败，文件可能被篡改或密钥错误！")
+        self.index = [INDEX_ENTRY.unpack_from(index, i * INDEX_ENTRY.size) for i in range(count)]
+        # 分块数、每个分块的位置和长度都必须与明文长度对应
+        if count != -(-self.size // self.chunk_size):
+            raise ValueError("容器分块数与明文长度不一致！")
+        for i, (chunk_off, chunk_len, _) in enumerate(self.index):
+            start = i * self.chunk_size
+            if chunk_off != HEADER.size + start or chunk_len != min(self.chunk_size, self.size - start):
+                raise ValueError("容器索引与明文长度不一致！")
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    # 读取明文区间 [offset, offset + length)
+    def read_at(self, offset, length):
+        if offset < 0 or length < 0:
+            raise ValueError("偏移和长度不能为负数！")
+        end = min(offset + length, self.size)
+        if offset >= end:
+            return b''
+        out = bytearray()
+        view = memoryview(self._mm)
+        try:
+            for i in range(offset // self.chunk_size, (end - 1) // self.chunk_size + 1):
+                chunk_off, chunk_len, tag = self.index[i]
+                ct = view[chunk_off:chunk_off + chunk_len]
+                if chunk_tag(self.mkey, self.nonce, i, ct) != tag:
+                    raise ValueError(f"分块 {i} 校验失败，文件可能被篡改！")
+                base = i * self.chunk_size
+                lo = max(offset, base) - base
+                hi = min(end, base + chunk_len) - base
+                first = lo // 16
+                plain = _ctr_xor(self.cipher, chunk_counter(self.nonce, i) + first,
+                                 ct[first * 16:hi], self._ctr_buf)
+                out += plain[lo - first * 16:]
+                ct.release()
+        finally:
+            view.release()
+        return bytes(out)
+
+    # 类文件接口
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self._pos = max(0, offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.size - self._pos
+        data = self.read_at(self._pos, n)
+        self._pos += len(data)
+        return data
+
+
+# 解密整个容器到 dst_path
+def decrypt_file(src_path, dst_path, key):
+    with ContainerReader(src_path, key) as reader, open(dst_path, 'wb') as dst:
+        for off in range(0, reader.size, reader.chunk_size):
+            dst.write(reader.read_at(off, reader.chunk_size))
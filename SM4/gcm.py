@@ -0,0 +1,182 @@
+import hmac
+import struct
+from functools import lru_cache
+
+from SM4 import SM4, xor_bytes
+
+# GHASH 的约减多项式 x^128 + x^7 + x^2 + x + 1（GCM 比特序）
+R = 0xE1 << 120
+MASK32 = 0xFFFFFFFF
+# 缓存的哈希密钥乘法表个数
+GCM_CACHE_SIZE = 256
+
+
+# 8 比特乘法表：TABLES[j][b] = (字节 j 取值 b 的分组) · H
+# 先算出 H·x^k（k = 0..127），再按线性关系组合出每个字节位置的 256 项
+def ghash_tables(H):
+    basis = []
+    v = H
+    for _ in range(128):
+        basis.append(v)
+        v = (v >> 1) ^ R if v & 1 else v >> 1
+    tables = []
+    for j in range(16):
+        tbl = [0] * 256
+        for b in range(1, 256):
+            low = b & -b                       # b 最低位的 1
+            m = 7 - (low.bit_length() - 1)     # 该位在字节内从高位数的序号
+            tbl[b] = tbl[b ^ low] ^ basis[8 * j + m]
+        tables.append(tbl)
+    return tables
+
+
+# 查表计算 y · H
+def gmul(y, tables):
+    z = 0
+    for j, b in enumerate(y.to_bytes(16, 'big')):
+        z ^= tables[j][b]
+    return z
+
+
+# 对若干完整分组做 GHASH 累加
+def ghash_update(y, data, tables):
+    for off in range(0, len(data), 16):
+        y = gmul(y ^ int.from_bytes(data[off:off + 16], 'big'), tables)
+    return y
+
+
+# 按密钥缓存分组密码、轮密钥和 GHASH 乘法表
+@lru_cache(maxsize=GCM_CACHE_SIZE)
+def gcm_context(key):
+    cipher = SM4(key)
+    H = int.from_bytes(cipher.encrypt(bytes(16)), 'big')
+    return cipher, ghash_tables(H)
+
+
+def gcm_cache_info():
+    return gcm_context.cache_info()
+
+
+# 对 data 做 GHASH 并补齐到 16 字节的倍数
+def _ghash_padded(y, data, tables):
+    full = len(data) - len(data) % 16
+    y = ghash_update(y, data[:full], tables)
+    if full < len(data):
+        y = ghash_update(y, bytes(data[full:]).ljust(16, b'\x00'), tables)
+    return y
+
+
+# GCM 流式加解密的公共部分
+class _GCMBase:
+    def __init__(self, key, iv, aad=b''):
+        if not iv:
+            raise ValueError("GCM 的 IV 不能为空！")
+        self.cipher, self._tables = gcm_context(bytes(key))
+        if len(iv) == 12:
+            j0 = (int.from_bytes(iv, 'big') << 32) | 1
+        else:
+            j0 = _ghash_padded(0, iv, self._tables)
+            j0 = gmul(j0 ^ (len(iv) * 8), self._tables)
+        self._j0 = j0
+        self._prefix = j0 & ~MASK32
+        self._ctr = (j0 + 1) & MASK32       # inc32(J0)
+        self._keystream = b''
+        self._aad_len = len(aad)
+        self._ct_len = 0
+        self._y = _ghash_padded(0, aad, self._tables)
+        self._ghash_buf = bytearray()        # 未满 16 字节的密文
+        self._finalized = False
+
+    # 批量生成 nblocks 个分组的密钥流，计数器只在低 32 位递增
+    def _keystream_blocks(self, nblocks):
+        buf = bytearray(nblocks * 16)
+        prefix, ctr = self._prefix, self._ctr
+        for i in range(nblocks):
+            struct.pack_into('>QII', buf, i * 16, prefix >> 64, (prefix >> 32) & MASK32, (ctr + i) & MASK32)
+        self._ctr = (ctr + nblocks) & MASK32
+        self.cipher.encrypt_blocks(buf)
+        return buf
+
+    def _xor_keystream(self, data):
+        out = bytearray()
+        if self._keystream:
+            n = min(len(data), len(self._keystream))
+            out += xor_bytes(data[:n], self._keystream[:n])
+            self._keystream = self._keystream[n:]
+            data = data[n:]
+        if data:
+            ks = self._keystream_blocks(-(-len(data) // 16))
+            out += xor_bytes(data, ks[:len(data)])
+            self._keystream = bytes(ks[len(data):])
+        return bytes(out)
+
+    # 把密文加入 GHASH，只处理完整分组，其余留到下一次
+    def _absorb(self, ct):
+        self._ct_len += len(ct)
+        self._ghash_buf += ct
+        full = len(self._ghash_buf) - len(self._ghash_buf) % 16
+        if full:
+            self._y = ghash_update(self._y, self._ghash_buf[:full], self._tables)
+            del self._ghash_buf[:full]
+
+    def _check(self):
+        if self._finalized:
+            raise ValueError("finalize() 之后不能再调用 update()！")
+
+    def _compute_tag(self):
+        self._finalized = True
+        y = _ghash_padded(self._y, self._ghash_buf, self._tables)
+        y = gmul(y ^ ((self._aad_len * 8) << 64) ^ (self._ct_len * 8), self._tables)
+        s = bytearray(self._j0.to_bytes(16, 'big'))
+        self.cipher.encrypt_block(s)
+        return xor_bytes(y.to_bytes(16, 'big'), s)
+
+
+class GCMEncryptor(_GCMBase):
+    def update(self, data):
+        self._check()
+        ct = self._xor_keystream(memoryview(data).cast('B'))
+        self._absorb(ct)
+        return ct
+
+    # 结束加密，标签保存在 self.tag 中
+    def finalize(self):
+        self._check()
+        self.tag = self._compute_tag()
+        return b''
+
+
+class GCMDecryptor(_GCMBase):
+    def __init__(self, key, iv, tag, aad=b''):
+        super().__init__(key, iv, aad)
+        if not 4 <= len(tag) <= 16:
+            raise ValueError("GCM 标签长度错误！")
+        self.tag = bytes(tag)
+
+    # 返回的明文在 finalize() 校验通过之前不可信
+    def update(self, data):
+        self._check()
+        data = memoryview(data).cast('B')
+        self._absorb(data)
+        return self._xor_keystream(data)
+
+    def finalize(self):
+        self._check()
+        tag = self._compute_tag()[:len(self.tag)]
+        if not hmac.compare_digest(tag, self.tag):
+            raise ValueError("GCM 标签校验失败，密文或附加数据被篡改！")
+        return b''
+
+
+# 一次性接口
+def sm4_gcm_encrypt(key, iv, plaintext, aad=b''):
+    enc = GCMEncryptor(key, iv, aad)
+    ct = enc.update(plaintext) + enc.finalize()
+    return ct, enc.tag
+
+
+def sm4_gcm_decrypt(key, iv, ciphertext, tag, aad=b''):
+    dec = GCMDecryptor(key, iv, tag, aad)
+    pt = dec.update(ciphertext)
+    dec.finalize()
+    return pt
@@ -0,0 +1,176 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from SM4 import SM4, ctr_keystream, pkcs7_unpad, xor_bytes
+
+# 每个进程任务处理的数据量，必须是 16 的整数倍
+SEGMENT_SIZE = 1 << 20
+
+# 工作进程中的轮密钥，在进程初始化时只计算一次
+_cipher = None
+
+
+def _init_worker(key):
+    global _cipher
+    _cipher = SM4(key)
+
+
+# 连接到共享内存；由父进程负责 unlink
+def _attach(name):
+    return shared_memory.SharedMemory(name=name)
+
+
+# CTR 分段：计数器从 counter 开始，结果直接写入输出共享内存
+def _ctr_segment(in_name, out_name, off, length, counter):
+    src, dst = _attach(in_name), _attach(out_name)
+    try:
+        ks = ctr_keystream(_cipher, counter, -(-length // 16))
+        dst.buf[off:off + length] = xor_bytes(src.buf[off:off + length], ks[:length])
+    finally:
+        src.close()
+        dst.close()
+
+
+# CBC 解密分段：iv 为前一段的最后一个密文分组
+# 整段批量解密，再与右移一个分组的密文（iv || C[0..n-2]）做一次异或
+def _cbc_decrypt_segment(in_name, out_name, off, length, iv):
+    src, dst = _attach(in_name), _attach(out_name)
+    try:
+        buf = bytearray(src.buf[off:off + length])
+        prev = iv + bytes(buf[:length - 16])
+        _cipher.decrypt_blocks(buf)
+        dst.buf[off:off + length] = xor_bytes(buf, prev)
+    finally:
+        src.close()
+        dst.close()
+
+
+# 共享内存缓冲区：工作进程按名字直接读写，父进程通过 view 访问，不需要再拷贝
+# 用完后调用 close() 释放；作为输入传给 ParallelSM4 时也不会再拷贝一次
+class SharedBuffer:
+    def __init__(self, size):
+        self.shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        self.view = self.shm.buf[:size]
+
+    @classmethod
+    def from_bytes(cls, data):
+        data = memoryview(data).cast('B')
+        buf = cls(len(data))
+        buf.view[:] = data
+        return buf
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def __len__(self):
+        return len(self.view)
+
+    def __bytes__(self):
+        return bytes(self.view)
+
+    # 缩短有效长度（如去掉 PKCS#7 填充），不移动数据
+    def truncate(self, size):
+        view = self.view
+        self.view = self.shm.buf[:size]
+        view.release()
+
+    def close(self):
+        if self.shm is None:
+            return
+        self.view.release()
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# 多进程 SM4 引擎：CTR 加解密和 CBC 解密的各个分组互不依赖，可以分段并行
+# 输入和输出都放在共享内存中，工作进程直接写入预先分配好的输出缓冲，不经过进程间管道回传
+class ParallelSM4:
+    def __init__(self, key, workers=None, segment_size=SEGMENT_SIZE):
+        if segment_size <= 0 or segment_size % 16:
+            raise ValueError("分段大小必须是 16 的正整数倍！")
+        self.key = bytes(key)
+        self.cipher = SM4(self.key)
+        self.workers = workers or os.cpu_count()
+        self.segment_size = segment_size
+        self.pool = ProcessPoolExecutor(self.workers, initializer=_init_worker, initargs=(self.key,))
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # 按段提交任务，工作进程直接写入输出共享内存，返回该 SharedBuffer
+    # data 不是 SharedBuffer 时先拷贝进共享内存；out 为 None 时新建输出缓冲，由调用者 close()
+    def _run(self, data, make_task, out=None):
+        src = data if isinstance(data, SharedBuffer) else SharedBuffer.from_bytes(data)
+        n = len(src)
+        dst = out if out is not None else SharedBuffer(n)
+        try:
+            if not isinstance(dst, SharedBuffer):
+                raise TypeError("输出缓冲区必须是 SharedBuffer！")
+            if len(dst) < n:
+                raise ValueError("输出缓冲区长度不足！")
+            futures = [self.pool.submit(*make_task(src, dst.name, off, min(self.segment_size, n - off)))
+                       for off in range(0, n, self.segment_size)]
+            for fut in futures:
+                fut.result()
+        except BaseException:
+            if out is None:
+                dst.close()
+            raise
+        finally:
+            if src is not data:
+                src.close()
+        return dst
+
+    # CTR 加密和解密相同；每段的计数器基值为 iv + 段起始分组号
+    def ctr(self, iv, data, out=None):
+        base = int.from_bytes(iv, 'big')
+
+        def task(src, dst, off, length):
+            return _ctr_segment, src.name, dst, off, length, (base + off // 16) % 2 ** 128
+        return self._run(data, task, out)
+
+    # CBC 解密；每段的 IV 为前一段最后一个密文分组，结果与串行解密逐字节相同
+    # 去填充只缩短返回缓冲区的有效长度
+    def cbc_decrypt(self, iv, data, padding=True, out=None):
+        if len(data) % 16:
+            raise ValueError("密文长度必须是 16 字节的整数倍！")
+
+        def task(src, dst, off, length):
+            seg_iv = bytes(iv) if off == 0 else bytes(src.view[off - 16:off])
+            return _cbc_decrypt_segment, src.name, dst, off, length, seg_iv
+        result = self._run(data, task, out)
+        if padding:
+            n = len(data)
+            try:
+                result.truncate(n - 16 + len(pkcs7_unpad(bytes(result.view[n - 16:n]))))
+            except ValueError:
+                if out is None:
+                    result.close()
+                raise
+        return result
+
+
+# 一次性接口：自动创建并关闭进程池，返回 bytes
+def ctr_crypt_parallel(key, iv, data, workers=None, segment_size=SEGMENT_SIZE):
+    with ParallelSM4(key, workers, segment_size) as engine, engine.ctr(iv, data) as result:
+        return bytes(result)
+
+
+def cbc_decrypt_parallel(key, iv, data, workers=None, segment_size=SEGMENT_SIZE, padding=True):
+    with ParallelSM4(key, workers, segment_size) as engine, engine.cbc_decrypt(iv, data, padding) as result:
+        return bytes(result)
@@ -1,25 +1,139 @@
 # auth_backend.py
 
-from gmssl import sm3, func
+import atexit
+import hmac
+import itertools
+import os
 import sqlite3
+import sys
+import threading
+import time
 import uuid
+from concurrent.futures import ProcessPoolExecutor
 import re
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'SM3'))
+from SM3 import pbkdf2_hmac_sm3, sm3_hash  # noqa: E402
+
 DB_NAME = 'users.db'
 
+# 口令哈希算法：pbkdf2-sm3 为 PBKDF2-HMAC-SM3，sm3 为旧版的单次 SM3(password + salt)
+PASSWORD_ALGORITHM = 'pbkdf2-sm3'
+LEGACY_ALGORITHM = 'sm3'
+# PBKDF2 迭代次数，为 None 时从数据库的 settings 表读取；表中没有时按 TARGET_LATENCY
+# 校准一次并保存，之后各个进程都使用同一个值。也可以用环境变量 PBKDF2_ITERATIONS 固定
+PASSWORD_ITERATIONS = int(os.environ['PBKDF2_ITERATIONS']) if os.environ.get('PBKDF2_ITERATIONS') else None
+# 单次口令哈希的目标耗时（秒）和迭代次数下限
+TARGET_LATENCY = 0.1
+MIN_ITERATIONS = 1000
+# 记录的迭代次数低于当前值的这个比例时才在登录时升级，避免校准的正常波动引起重算
+REHASH_TOLERANCE = 0.8
+
+# 连接参数：WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下仍能保证崩溃一致性
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA cache_size=-16000',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+# 每个连接缓存的预编译语句数量
+STATEMENT_CACHE_SIZE = 128
+
+# 固定的 SQL 语句，sqlite3 模块按语句文本缓存预编译结果
+SQL_CREATE = '''
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        algorithm TEXT NOT NULL DEFAULT 'sm3',
+        iterations INTEGER NOT NULL DEFAULT 1
+    )
+'''
+# 旧数据库没有算法和迭代次数两列，补上后原有记录即为旧版单次 SM3
+SQL_ADD_COLUMNS = {
+    'algorithm': "ALTER TABLE users ADD COLUMN algorithm TEXT NOT NULL DEFAULT 'sm3'",
+    'iterations': 'ALTER TABLE users ADD COLUMN iterations INTEGER NOT NULL DEFAULT 1',
+}
+SQL_INSERT = ('INSERT INTO users (username, password_hash, salt, algorithm, iterations) VALUES (?, ?, ?, ?, ?) '
+              'ON CONFLICT(username) DO NOTHING')
+SQL_SELECT = 'SELECT password_hash, salt, algorithm, iterations FROM users WHERE username=?'
+SQL_UPDATE = 'UPDATE users SET password_hash=?, salt=?, algorithm=?, iterations=? WHERE username=?'
+# 登录时升级哈希，只有口令在此期间未被修改时才覆盖
+SQL_REHASH = 'UPDATE users SET password_hash=?, salt=?, algorithm=?, iterations=? WHERE username=? AND password_hash=?'
+SQL_EXISTS = 'SELECT 1 FROM users WHERE username=?'
+SQL_CREATE_SETTINGS = 'CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)'
+SQL_GET_SETTING = 'SELECT value FROM settings WHERE name=?'
+# 并发初始化时只有第一个写入的值生效
+SQL_INIT_SETTING = 'INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT(name) DO NOTHING'
+SQL_SET_SETTING = 'INSERT INTO settings (name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value=excluded.value'
+SQL_INSERT_MANY = SQL_INSERT
+
+# 批量接口：每个事务写入的行数、每个哈希任务的行数、IN (...) 查询一次带的参数个数
+BULK_BATCH_SIZE = 10000
+HASH_CHUNK_SIZE = 500
+IN_QUERY_SIZE = 500
+
+
+class ConnectionManager:
+    """
+    数据库连接管理：每个线程持有一个长连接，首次使用时打开并设置参数
+    :param db_name: 数据库文件名，为 None 时使用模块的 DB_NAME
+    """
+
+    def __init__(self, db_name=None):
+        self.db_name = db_name
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = {}
+
+    def get(self):
+        """
+        获取当前线程的连接
+        :return: sqlite3.Connection
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name or DB_NAME, check_same_thread=False,
+                                   cached_statements=STATEMENT_CACHE_SIZE)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._lock:
+                # 顺便关闭已结束线程留下的连接
+                for thread in [t for t in self._conns if not t.is_alive()]:
+                    self._conns.pop(thread).close()
+                self._conns[threading.current_thread()] = conn
+        return conn
+
+    def close_all(self):
+        """关闭所有线程打开的连接，之后再次使用时会重新连接"""
+        with self._lock:
+            conns, self._conns = self._conns, {}
+        for conn in conns.values():
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+db = ConnectionManager()
+atexit.register(db.close_all)
+
+
 def init_db():
     """初始化数据库，创建用户表（如果不存在）"""
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    username TEXT PRIMARY KEY,
-                    password_hash TEXT NOT NULL,
-                    salt TEXT NOT NULL
-                )
-            ''')
-            conn.commit()
+        conn = db.get()
+        with conn:
+            conn.execute(SQL_CREATE)
+            conn.execute(SQL_CREATE_SETTINGS)
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(users)')}
+            for column, sql in SQL_ADD_COLUMNS.items():
+                if column not in columns:
+                    conn.execute(sql)
     except sqlite3.Error as e:
         print(f"数据库初始化失败: {e}")
 
@@ -36,41 +150,37 @@ def register_user(username, password):
     if not is_valid_password(password):
         return False, '密码强度不足，需包含字母和数字，长度至少8位！'
 
-    if user_exists(username):
-        return False, '用户名已存在！'
-
-    # 生成随机盐值
-    salt = uuid.uuid4().hex
-    password_hash = hash_password(password, salt)
+    # 生成随机盐值并哈希密码
+    record = new_password_record(password)
 
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            # 存储新用户
-            cursor.execute('INSERT INTO users (username, password_hash, salt) VALUES (?, ?, ?)', (username, password_hash, salt))
-            conn.commit()
+        conn = db.get()
+        # 存储新用户，用户名冲突时不插入；存在性检查和插入在同一条语句中原子完成
+        with conn:
+            inserted = conn.execute(SQL_INSERT, (username,) + record).rowcount
+        if not inserted:
+            return False, '用户名已存在！'
         return True, '注册成功！'
     except sqlite3.Error as e:
         return False, f'注册失败，数据库错误: {e}'
 
 def login_user(username, password):
     """
-    用户登录验证
+    用户登录验证，旧算法或迭代次数不足的记录在登录成功后自动升级
     :param username: 用户名
     :param password: 密码
     :return: (boolean, message) 登录是否成功及信息
     """
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            # 获取存储的密码哈希和盐值
-            cursor.execute('SELECT password_hash, salt FROM users WHERE username=?', (username,))
-            result = cursor.fetchone()
+        # 获取存储的密码哈希、盐值、算法和迭代次数
+        conn = db.get()
+        result = conn.execute(SQL_SELECT, (username,)).fetchone()
 
         if result:
-            stored_password_hash, salt = result
-            password_hash_input = hash_password(password, salt)
-            if password_hash_input == stored_password_hash:
+            stored_password_hash, salt, algorithm, iterations = result
+            if verify_password(password, stored_password_hash, salt, algorithm, iterations):
+                if needs_rehash(algorithm, iterations):
+                    _rehash(conn, username, password, stored_password_hash)
                 return True, '登录成功！'
             else:
                 return False, '密码错误！'
@@ -92,19 +202,16 @@ def change_password(username, new_password):
     if not is_valid_password(new_password):
         return False, '新密码强度不足，需包含字母和数字，长度至少8位！'
 
-    if not user_exists(username):
-        return False, '用户不存在！'
-
     # 生成新的盐值并哈希密码
-    new_salt = uuid.uuid4().hex
-    new_password_hash = hash_password(new_password, new_salt)
+    record = new_password_record(new_password)
 
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            # 更新密码哈希和盐值
-            cursor.execute('UPDATE users SET password_hash=?, salt=? WHERE username=?', (new_password_hash, new_salt, username))
-            conn.commit()
+        conn = db.get()
+        # 更新密码哈希和盐值，没有更新到任何行说明用户不存在
+        with conn:
+            updated = conn.execute(SQL_UPDATE, record + (username,)).rowcount
+        if not updated:
+            return False, '用户不存在！'
         return True, '密码修改成功！'
     except sqlite3.Error as e:
         return False, f'修改密码失败，数据库错误: {e}'
@@ -116,26 +223,107 @@ def user_exists(username):
     :return: True or False
     """
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT 1 FROM users WHERE username=?', (username,))
-            return cursor.fetchone() is not None
+        return db.get().execute(SQL_EXISTS, (username,)).fetchone() is not None
     except sqlite3.Error as e:
         print(f"数据库查询失败: {e}")
         return False
 
-def hash_password(password, salt):
+def hash_password(password, salt, algorithm=PASSWORD_ALGORITHM, iterations=None):
     """
     使用SM3算法和盐值对密码进行哈希处理
     :param password: 明文密码
     :param salt: 盐值
+    :param algorithm: 'pbkdf2-sm3'（PBKDF2-HMAC-SM3）或旧版的 'sm3'（单次 SM3(password + salt)）
+    :param iterations: PBKDF2 迭代次数，默认为 password_iterations()
     :return: 哈希值
     """
-    # 将密码和盐值组合
-    combined = password + salt
-    hash_bytes = combined.encode('utf-8')
-    hash_hex = sm3.sm3_hash(func.bytes_to_list(hash_bytes))
-    return hash_hex
+    if algorithm == LEGACY_ALGORITHM:
+        # 将密码和盐值组合
+        return sm3_hash(password + salt)
+    if algorithm != PASSWORD_ALGORITHM:
+        raise ValueError(f'未知的口令哈希算法: {algorithm}')
+    return pbkdf2_hmac_sm3(password, salt, iterations or password_iterations()).hex()
+
+def verify_password(password, stored_hash, salt, algorithm, iterations):
+    """
+    按记录中的算法和迭代次数校验密码
+    :return: True or False
+    """
+    return hmac.compare_digest(hash_password(password, salt, algorithm, iterations), stored_hash)
+
+def needs_rehash(algorithm, iterations):
+    """
+    记录是否需要升级到当前算法和迭代次数
+    :return: True or False
+    """
+    return algorithm != PASSWORD_ALGORITHM or iterations < REHASH_TOLERANCE * password_iterations()
+
+def new_password_record(password, iterations=None):
+    """
+    用新的随机盐值和当前算法哈希密码
+    :return: (password_hash, salt, algorithm, iterations)
+    """
+    iterations = iterations or password_iterations()
+    salt = uuid.uuid4().hex
+    return hash_password(password, salt, PASSWORD_ALGORITHM, iterations), salt, PASSWORD_ALGORITHM, iterations
+
+def _rehash(conn, username, password, old_hash):
+    """登录成功后把记录升级到当前算法；失败不影响本次登录"""
+    try:
+        with conn:
+            conn.execute(SQL_REHASH, new_password_record(password) + (username, old_hash))
+    except sqlite3.Error as e:
+        print(f"口令哈希升级失败: {e}")
+
+def calibrate_iterations(target=TARGET_LATENCY, minimum=MIN_ITERATIONS):
+    """
+    按本机速度选择 PBKDF2 迭代次数，使一次口令哈希大约耗时 target 秒
+    :param target: 目标耗时（秒）
+    :param minimum: 迭代次数下限
+    :return: 迭代次数
+    """
+    # 逐步加大试算规模，直到耗时足够长、计时误差可以忽略
+    iterations = 64
+    while True:
+        start = time.perf_counter()
+        pbkdf2_hmac_sm3(b'calibrate', b'salt', iterations)
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.02 or iterations >= 1 << 24:
+            break
+        iterations *= 4
+    return max(minimum, int(iterations * target / max(elapsed, 1e-9)))
+
+def password_iterations():
+    """
+    当前使用的 PBKDF2 迭代次数：优先使用已配置的值，其次是数据库中保存的值，
+    都没有时校准一次并保存
+    :return: 迭代次数
+    """
+    global PASSWORD_ITERATIONS
+    if PASSWORD_ITERATIONS is None:
+        conn = db.get()
+        row = conn.execute(SQL_GET_SETTING, ('pbkdf2_iterations',)).fetchone()
+        if row is None:
+            with conn:
+                conn.execute(SQL_INIT_SETTING, ('pbkdf2_iterations', str(calibrate_iterations())))
+            row = conn.execute(SQL_GET_SETTING, ('pbkdf2_iterations',)).fetchone()
+        PASSWORD_ITERATIONS = int(row[0])
+    return PASSWORD_ITERATIONS
+
+def set_password_iterations(iterations):
+    """
+    修改并保存 PBKDF2 迭代次数，如 set_password_iterations(calibrate_iterations(0.2))；
+    已有记录在下次登录时按 REHASH_TOLERANCE 决定是否升级
+    :param iterations: 迭代次数
+    """
+    global PASSWORD_ITERATIONS
+    iterations = int(iterations)
+    if iterations < 1:
+        raise ValueError('迭代次数必须是正整数！')
+    conn = db.get()
+    with conn:
+        conn.execute(SQL_SET_SETTING, ('pbkdf2_iterations', str(iterations)))
+    PASSWORD_ITERATIONS = iterations
 
 def is_valid_password(password):
     """
@@ -151,5 +339,196 @@ def is_valid_password(password):
         return False
     return True
 
+class BulkStats:
+    """批量操作的进度和吞吐量计数"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.done = 0
+        self.ok = 0
+        self.failed = 0
+
+    def add(self, results):
+        """
+        累加一批结果
+        :param results: [(username, success, message), ...]
+        """
+        ok = sum(1 for _, success, _ in results if success)
+        self.done += len(results)
+        self.ok += ok
+        self.failed += len(results) - ok
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def rate(self):
+        """每秒处理的行数"""
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def __str__(self):
+        return f'已处理 {self.done} 行（成功 {self.ok}，失败 {self.failed}），用时 {self.elapsed:.1f}s，{self.rate:.0f} 行/秒'
+
+
+def print_progress(stats):
+    """默认的进度输出"""
+    print(stats)
+
+
+def _batches(iterable, size):
+    """把输入按 size 行一批依次取出，不会一次读入全部数据"""
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _hash_new(rows):
+    """
+    工作进程：为每个 (username, password, iterations) 生成盐值并计算哈希
+    :return: [(username, password_hash, salt, algorithm, iterations), ...]
+    """
+    return [(username,) + new_password_record(password, iterations) for username, password, iterations in rows]
+
+
+def _check_passwords(rows):
+    """
+    工作进程：校验每个 (password, stored_hash, salt, algorithm, iterations)
+    :return: [True/False, ...]
+    """
+    return [verify_password(*row) for row in rows]
+
+
+def _parallel_map(pool, func, rows):
+    """按 HASH_CHUNK_SIZE 分块交给进程池，pool 为 None 时在当前进程计算"""
+    chunks = [rows[i:i + HASH_CHUNK_SIZE] for i in range(0, len(rows), HASH_CHUNK_SIZE)]
+    mapper = pool.map if pool is not None else map
+    return [item for chunk in mapper(func, chunks) for item in chunk]
+
+
+def _existing_users(conn, usernames):
+    """查询 usernames 中已存在的用户名"""
+    found = set()
+    for i in range(0, len(usernames), IN_QUERY_SIZE):
+        part = usernames[i:i + IN_QUERY_SIZE]
+        sql = f'SELECT username FROM users WHERE username IN ({",".join("?" * len(part))})'
+        found.update(row[0] for row in conn.execute(sql, part))
+    return found
+
+
+def _stored_hashes(conn, usernames):
+    """查询 usernames 对应的 (password_hash, salt, algorithm, iterations)"""
+    found = {}
+    for i in range(0, len(usernames), IN_QUERY_SIZE):
+        part = usernames[i:i + IN_QUERY_SIZE]
+        sql = (f'SELECT username, password_hash, salt, algorithm, iterations FROM users '
+               f'WHERE username IN ({",".join("?" * len(part))})')
+        found.update((row[0], row[1:]) for row in conn.execute(sql, part))
+    return found
+
+
+def _make_pool(workers):
+    workers = os.cpu_count() if workers is None else workers
+    return ProcessPoolExecutor(workers) if workers > 1 else None
+
+
+def register_users_bulk(users, workers=None, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    批量注册用户，输入逐批读取，密码哈希在多个进程中并行计算，每批在一个事务中写入
+    :param users: 可迭代的 (username, password)
+    :param workers: 哈希进程数，默认为 CPU 核数，小于等于 1 时在当前进程计算
+    :param batch_size: 每个事务写入的行数
+    :param progress: 每批完成后调用 progress(BulkStats)，可传入 print_progress
+    :return: [(username, success, message), ...]，与输入一一对应
+    """
+    stats = BulkStats()
+    results = []
+    conn = db.get()
+    pool = _make_pool(workers)
+    try:
+        for batch in _batches(users, batch_size):
+            outcome = [None] * len(batch)
+            seen = set()
+            todo = []
+            for i, (username, password) in enumerate(batch):
+                if not username or not password:
+                    outcome[i] = (username, False, '用户名和密码不能为空！')
+                elif not is_valid_password(password):
+                    outcome[i] = (username, False, '密码强度不足，需包含字母和数字，长度至少8位！')
+                elif username in seen:
+                    outcome[i] = (username, False, '用户名已存在！')
+                else:
+                    seen.add(username)
+                    todo.append(i)
+            # 先去掉已存在的用户，避免为它们计算哈希
+            existing = _existing_users(conn, [batch[i][0] for i in todo])
+            for i in todo:
+                if batch[i][0] in existing:
+                    outcome[i] = (batch[i][0], False, '用户名已存在！')
+            todo = [i for i in todo if outcome[i] is None]
+            # 迭代次数在父进程中确定，工作进程不再各自校准
+            iterations = password_iterations()
+            rows = _parallel_map(pool, _hash_new, [(batch[i][0], batch[i][1], iterations) for i in todo])
+            try:
+                with conn:
+                    # 写锁下再检查一次，其他连接可能在计算哈希期间插入了同名用户
+                    conn.execute('BEGIN IMMEDIATE')
+                    existing = _existing_users(conn, [row[0] for row in rows])
+                    conn.executemany(SQL_INSERT_MANY, (row for row in rows if row[0] not in existing))
+                for i, row in zip(todo, rows):
+                    outcome[i] = (row[0], False, '用户名已存在！') if row[0] in existing else (row[0], True, '注册成功！')
+            except sqlite3.Error as e:
+                for i in todo:
+                    outcome[i] = (batch[i][0], False, f'注册失败，数据库错误: {e}')
+            results.extend(outcome)
+            stats.add(outcome)
+            if progress:
+                progress(stats)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
+def verify_logins_bulk(pairs, workers=None, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    批量校验用户名和密码，每批用一次查询取出存储的哈希，哈希在多个进程中并行计算
+    :param pairs: 可迭代的 (username, password)
+    :param workers: 哈希进程数，默认为 CPU 核数，小于等于 1 时在当前进程计算
+    :param batch_size: 每批的行数
+    :param progress: 每批完成后调用 progress(BulkStats)
+    :return: [(username, success, message), ...]，与输入一一对应
+    """
+    stats = BulkStats()
+    results = []
+    conn = db.get()
+    pool = _make_pool(workers)
+    try:
+        for batch in _batches(pairs, batch_size):
+            try:
+                stored = _stored_hashes(conn, list({username for username, _ in batch}))
+            except sqlite3.Error as e:
+                outcome = [(username, False, f'登录失败，数据库错误: {e}') for username, _ in batch]
+            else:
+                todo = [i for i, (username, _) in enumerate(batch) if username in stored]
+                checks = _parallel_map(pool, _check_passwords,
+                                       [(batch[i][1],) + stored[batch[i][0]] for i in todo])
+                outcome = [(username, False, '用户不存在！') for username, _ in batch]
+                for i, ok in zip(todo, checks):
+                    outcome[i] = (batch[i][0], ok, '登录成功！' if ok else '密码错误！')
+            results.extend(outcome)
+            stats.add(outcome)
+            if progress:
+                progress(stats)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return results
+
+
 # 初始化数据库
 init_db()
\ No newline at end of file